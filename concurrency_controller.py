@@ -0,0 +1,158 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""ConcurrencyController adapts the number of requests in flight using additive
+increase, multiplicative decrease (AIMD). The limit grows by additive_increase
+per limit's worth of successful requests, and shrinks by multiplicative_decrease
+on an error or when short-term smoothed latency exceeds latency_tolerance times
+the long-term smoothed latency, which indicates requests queueing at the source.
+The long-term baseline follows latency slowly, so a lasting shift in latency is
+eventually accepted as normal. At most one decrease happens per round trip, so
+a burst of failures from requests sent together counts as a single signal.
+
+Example:
+    import concurrency_controller
+    controller = concurrency_controller.ConcurrencyController({
+        'min_concurrency': 2,
+        'max_concurrency': 200,
+        'initial_concurrency': 10,
+        'additive_increase': 1,
+        'multiplicative_decrease': .5,
+        'latency_tolerance': 2,
+    })
+    start_time = controller.acquire()  # Blocks until below the limit.
+    is_error = do_request()
+    controller.release(start_time, is_error)
+    if not is_error and not is_valid_response():
+        controller.report_error(start_time)  # Optional.
+"""
+
+import logging
+import threading
+import time
+
+class ConcurrencyController(object):
+    """Contains all functionality for the concurrency_controller module.
+    """
+    _LATENCY_ALPHA = .1
+    _BASELINE_ALPHA = .01
+
+    def __init__(self, config):
+        """ConcurrencyController must be initialized with args similar to those
+        shown in the example at the top of this file.
+
+        Args:
+            config: Determines the behavior of this instance.
+        """
+        self._config = config
+        self._logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._max_concurrency = config.get('max_concurrency', 100)
+        self._limit = min(self._max_concurrency, float(config.get(
+            'initial_concurrency', config.get('min_concurrency', 1))))
+        self._in_flight = 0
+        self._latency = None
+        self._baseline_latency = None
+        self._last_decrease_time = 0.0
+
+    def get_limit(self):
+        """Returns the current limit on requests in flight.
+        """
+        with self._condition:
+            return int(self._limit)
+
+    def set_max_concurrency(self, max_concurrency):
+        """Lowers max_concurrency of config to a ceiling imposed elsewhere,
+        e.g. a limit on requests in flight to each host, so the limit does not
+        grow past what can actually be in flight.
+
+        Args:
+            max_concurrency: The new upper bound on the limit.
+        """
+        with self._condition:
+            self._max_concurrency = min(self._config.get(
+                'max_concurrency', 100), max_concurrency)
+            self._limit = min(self._limit, float(self._max_concurrency))
+            self._condition.notify_all()
+
+    def acquire(self):
+        """Blocks until a request may be sent, and returns its start time to be
+        passed to release().
+        """
+        with self._condition:
+            while self._in_flight >= int(self._limit):
+                self._condition.wait()
+            self._in_flight += 1
+            return time.time()
+
+    def release(self, start_time, is_error, end_time=None):
+        """Records the outcome of a request, frees its slot and adjusts the
+        limit.
+
+        Args:
+            start_time: Value returned by acquire() for this request.
+            is_error: Whether the request failed.
+            end_time: When the response was received. Defaults to now.
+        """
+        latency = (time.time() if end_time is None else end_time) - start_time
+        with self._condition:
+            self._in_flight -= 1
+            if not is_error:
+                self._latency = self._smooth(
+                    self._latency, latency, self._LATENCY_ALPHA)
+                self._baseline_latency = self._smooth(
+                    self._baseline_latency, latency, self._BASELINE_ALPHA)
+
+            is_congested = is_error or self._latency > (
+                self._baseline_latency * self._config.get(
+                    'latency_tolerance', 2.0))
+            if is_congested:
+                self._decrease(start_time)
+            else:
+                self._limit = min(self._max_concurrency, (
+                    self._limit + self._config.get(
+                        'additive_increase', 1.0) / self._limit))
+            self._condition.notify_all()
+
+    def report_error(self, start_time):
+        """Records an error found after a request was released, e.g. an
+        invalid response, and decreases the limit.
+
+        Args:
+            start_time: Value returned by acquire() for the request.
+        """
+        with self._condition:
+            self._decrease(start_time)
+
+    def _decrease(self, start_time):
+        """Decreases the limit unless it already decreased for a request sent
+        after this one. Must be called holding the condition.
+        """
+        if start_time <= self._last_decrease_time:
+            return
+        self._limit = max(self._config.get('min_concurrency', 1), (
+            self._limit * self._config.get('multiplicative_decrease', .5)))
+        self._last_decrease_time = time.time()
+        self._logger.info('Decreased concurrency to: {}'.format(
+            int(self._limit)))
+
+    @staticmethod
+    def _smooth(average, value, alpha):
+        """Returns an exponentially weighted moving average updated with value,
+        or value if there is no average yet.
+        """
+        if average is None:
+            return value
+        return alpha * value + (1.0 - alpha) * average
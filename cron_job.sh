@@ -19,16 +19,10 @@
 # length.
 today=`/bin/date +%Y%m%d`  # YYYYMMDD today.
 
-portfolio_start_date="20160101"
-portfolio_cmd="./main.py --config_file portfolio_config_local.yaml
-  --output_dir portfolio_data/${today}/
-  --start_date ${portfolio_start_date}
-  --end_date ${today}"
-
-universe_start_date=`/bin/date --date="8 weeks ago" +%Y%m%d`  # YYYYMMDD 8 weeks ago.
-universe_cmd="./main.py --config_file universe_config_local.yaml
-  --output_dir universe_data/${today}/
-  --start_date ${universe_start_date}
+# Both reports are created from one dataset. Symbols and start dates are taken
+# from the report configs listed in multi_report_config_local.yaml.
+multi_report_cmd="./main.py --config_file multi_report_config_local.yaml
+  --output_dir multi_report_data/${today}/
   --end_date ${today}"
 
 eval "export PYTHONPATH=/home/ubuntu/devel"
@@ -50,5 +44,4 @@ eval_with_retry() {
   done
 }
 
-eval_with_retry "$portfolio_cmd"
-eval_with_retry "$universe_cmd"
+eval_with_retry "$multi_report_cmd"
@@ -0,0 +1,137 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Contains functions for saving daily dataframes to disk in a columnar format
+and loading them via memory mapping. Loading is near zero-copy, only the pages
+of fields and dates which are actually touched get read, and any number of
+processes can share the same store without duplicating memory.
+
+A store is a directory of .npy files:
+    index.npy: int64 nanoseconds since epoch for each date in ascending order.
+    symbols.npy: Names of columns.
+    <field>.npy: float64 array of shape (dates, symbols) in row-major order.
+    status.npy, status_symbols.npy: Optional validation_utils status of each
+        symbol validated, including those dropped from the dataframes.
+
+Example:
+    import dataset_store
+    dataset_store.save(daily, 'data/20160115/daily/')
+    daily = dataset_store.load('data/20160115/daily/', fields=['adj_close'],
+                               start_date='20160101')
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ('close', 'adj_close', 'volume')
+
+def exists(path):
+    """Returns whether a complete store exists at the given path.
+
+    Args:
+        path: Directory of the store.
+    """
+    return os.path.exists(os.path.join(path, 'index.npy'))
+
+def save(daily, path, status=None):
+    """Saves daily dataframes as a store. The store is written to a temporary
+    directory and then renamed, so readers never see a partial store.
+
+    Args:
+        daily: dict of pandas.DataFrame of the type returned by
+            historical_data.get_daily().
+        path: Directory of the store. Any existing store there is replaced.
+        status: Optional pandas.Series of the type returned by
+            validation_utils.get_status().
+    """
+    index = daily[FIELDS[0]].index
+    columns = daily[FIELDS[0]].columns
+    temp_path = os.path.normpath(path) + '.tmp'
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    os.makedirs(temp_path)
+
+    np.save(os.path.join(temp_path, 'symbols.npy'), np.array(
+        [str(x) for x in columns]))
+    for field in FIELDS:
+        values = daily[field].reindex(index=index, columns=columns).values
+        np.save(os.path.join(temp_path, field + '.npy'), np.ascontiguousarray(
+            values, dtype=np.float64))
+    if status is not None:
+        np.save(os.path.join(temp_path, 'status_symbols.npy'), np.array(
+            [str(x) for x in status.index]))
+        np.save(os.path.join(temp_path, 'status.npy'), status.values.astype(
+            np.uint8))
+
+    # Index is written last since its presence marks a complete store.
+    np.save(os.path.join(temp_path, 'index.npy'), index.values.astype(
+        'datetime64[ns]').view(np.int64))
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(temp_path, os.path.normpath(path))
+
+def load_dates(path):
+    """Loads only the dates of a store as a pandas.DatetimeIndex.
+
+    Args:
+        path: Directory of the store.
+    """
+    return pd.DatetimeIndex(np.load(os.path.join(path, 'index.npy')).view(
+        'datetime64[ns]'), name='Date')
+
+def load_status(path):
+    """Loads the status of a store as a pandas.Series indexed by symbol, or
+    returns None if it was saved without one.
+
+    Args:
+        path: Directory of the store.
+    """
+    if not os.path.exists(os.path.join(path, 'status.npy')):
+        return None
+    return pd.Series(np.load(os.path.join(path, 'status.npy')), index=np.load(
+        os.path.join(path, 'status_symbols.npy')).tolist(), name='status')
+
+def load(path, fields=None, start_date=None, end_date=None):
+    """Loads daily dataframes from a store. Dataframes are read-only views of
+    memory mapped files.
+
+    Args:
+        path: Directory of the store.
+        fields: List of fields to load. Defaults to all fields.
+        start_date: First date to load, of format YYYYMMDD. Defaults to the
+            first date in the store.
+        end_date: Last date to load, of format YYYYMMDD. Defaults to the last
+            date in the store.
+    """
+    index = np.load(os.path.join(path, 'index.npy'))
+    symbols = np.load(os.path.join(path, 'symbols.npy')).tolist()
+
+    # Dates are sorted, so slice rows with binary search.
+    start = 0 if start_date is None else np.searchsorted(
+        index, pd.to_datetime(start_date).value, side='left')
+    stop = index.size if end_date is None else np.searchsorted(
+        index, pd.to_datetime(end_date).value, side='right')
+    dates = pd.DatetimeIndex(index[start:stop].view('datetime64[ns]'),
+                             name='Date')
+
+    daily = {}
+    for field in (FIELDS if fields is None else fields):
+        values = np.load(os.path.join(path, field + '.npy'), mmap_mode='r')
+        daily[field] = pd.DataFrame(values[start:stop], index=dates,
+                                    columns=symbols, copy=False)
+    return daily
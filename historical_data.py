@@ -16,51 +16,161 @@
 """HistoricalData scrapes daily historical data from Yahoo Finance.
 
 It scrapes, performs simple validation, and saves the result to disk as CSV and
-pandas dataframes. It prefers to load data from files if they already exist.
-This is convenient in the event scraping is interrupted and must be restarted.
+a memory mapped columnar dataset (see dataset_store). It prefers to load data
+from files if they already exist. This is convenient in the event scraping is
+interrupted and must be restarted.
+
+If incremental is set, symbols are merged with those from the most recent prior
+dataset found in a sibling of output_dir, and only the missing dates are
+scraped.
+
+If trading_calendar is set, end_date is moved back to the last trading session
+on or before it, so weekends and holidays do not fail validation, and
+has_new_session() tells whether a run would find anything new.
+
+Symbols with null prices, or null or zero volume, are dropped from the
+dataframes. Every symbol is also checked for stale prices and extreme jumps per
+validation_config, and get_status() returns the validation_utils status bitmask
+of each, which is saved with the dataset.
+
+If raw_storage is 'packed', raw data is stored in a single packed_archive in
+output_dir instead of one CSV file per symbol, so resuming is a single read. If
+record_path is set, every scraped url and its raw response are also appended to
+a packed_archive at that path, which replay_server can serve offline.
+
+If history_cache_dir is set, raw data is kept in a history_cache shared by all
+output dirs and configs instead. Symbols it fully covers need no scrape, and
+symbols it partly covers are scraped incrementally.
+
+If shard_count is set, only the symbols of one shard of symbols_file are
+scraped, where symbol i of the file is in shard i % shard_count, so several
+processes or hosts can each handle a shard of a universe.
 
 Example:
     import historical_data
     data = historical_data.HistoricalData({
-        'symbols_file': 'symbols.csv',
+        'symbols_file': 'symbols.csv',  # Or a list of files.
         'output_dir': 'data/20160115/',
         'end_date': '20160115',
         'start_date': '20150701',
+        'incremental': True,  # Optional.
+        'ingest_process_count': 4,  # Optional.
+        'streaming': False,  # Optional.
+        'retry_config': {  # Optional.
+            'retry_count': 4,
+            'budget': 100,
+            'backoff_seconds': 2,
+            'rotate_failure_rate': .5,
+        },
+        'fetcher': 'tor_scraper',  # Optional, or 'http_fetcher'.
+        'base_url': 'http://localhost:8000/table.csv',  # Optional.
+        'record_path': 'recordings/20160115',  # Optional.
+        'raw_storage': 'files',  # Optional, or 'packed'.
+        'history_cache_dir': 'history_cache/',  # Optional.
+        'trading_calendar': True,  # Optional.
+        'extra_closures': ['20121029', '20121030'],  # Optional.
+        'shard_index': 0,  # Optional, with shard_count.
+        'shard_count': 4,  # Optional.
+        'validation_config': {  # Optional.
+            'max_stale_days': 10,
+            'max_abs_return': 1.0,
+        },
     }, tor_scraper_config)  # See tor_scraper documentation.
     daily_data = data.get_daily()
 """
 
 import csv
-import io
 import logging
 import os
 import pickle
+import subprocess
+import time
 
 import numpy as np
 import pandas as pd
 
+import dataset_store
+import history_cache
+import http_fetcher
+import ingest_utils
+import packed_archive
 import tor_scraper
+import trading_calendar
+import validation_utils
+
+_BASE_URL = 'http://real-chart.finance.yahoo.com/table.csv'
+_CSV_HEADER = 'Date,Open,High,Low,Close,Volume,Adj Close'
+_RAW_ARCHIVE_NAME = 'raw'
 
 class HistoricalData(object):
     """Contains the entire historical_data module.
     """
-    def __init__(self, historical_data_config, tor_scraper_config):
+    def __init__(self, historical_data_config, tor_scraper_config,
+                 http_fetcher_config=None):
         """HistoricalData must be initialized with args similar to those shown
         in the example at the top of this file.
 
         Args:
             historical_data_config: Determines the behavior of this instance.
             tor_scraper_config: Passed through to tor_scraper.
+            http_fetcher_config: Passed through to http_fetcher, if fetcher is
+                'http_fetcher' in historical_data_config.
         """
         self._config = historical_data_config
+        if historical_data_config.get('trading_calendar', False):
+            self._config = dict(historical_data_config)
+            self._config['end_date'] = trading_calendar.get_last_session(
+                historical_data_config['end_date'], historical_data_config.get(
+                    'extra_closures', ()))
         self._tor_scraper_config = tor_scraper_config
+        self._http_fetcher_config = http_fetcher_config
         self._logger = logging.getLogger(__name__)
+        self._status = None
+        self._history_cache = None
+        if 'history_cache_dir' in historical_data_config:
+            self._history_cache = history_cache.HistoryCache(
+                historical_data_config['history_cache_dir'])
+        self._recorder = None
+        if 'record_path' in historical_data_config:
+            self._recorder = packed_archive.PackedArchive(
+                historical_data_config['record_path'])
+
+    def has_new_session(self):
+        """Returns whether there may be a trading session to scrape which is
+        not already in the most recent prior dataset. Always True unless
+        trading_calendar is set.
+        """
+        if not self._config.get('trading_calendar', False):
+            return True
+        prior_dir = self._find_prior_dir()
+        if prior_dir is None:
+            return True
+        if dataset_store.exists(prior_dir + 'daily/'):
+            prior_dates = dataset_store.load_dates(prior_dir + 'daily/')
+        else:
+            with open(prior_dir + 'daily.pickle', 'rb') as pickle_file:
+                prior_dates = pickle.load(pickle_file)['close'].index
+        return pd.to_datetime(self._config['end_date']) > prior_dates.max()
+
+    def get_status(self):
+        """Returns the validation_utils status of every symbol validated by
+        the last call to get_daily(), or None if unknown, e.g. for a dataset
+        written by an earlier version.
+        """
+        return self._status
 
     def get_daily(self):
         """Fetch up-to-date data either from disk or from the web.
         """
-        # If valid pickle for data already exists, return that. If not, create
-        # output dir if needed and proceed with scrape.
+        # If valid dataset already exists, return that. Pickle files written by
+        # earlier versions are still read. If not, create output dir if needed
+        # and proceed with scrape.
+        dataset_path = self._config['output_dir'] + 'daily/'
+        if dataset_store.exists(dataset_path):
+            self._logger.info('Dataset already exists for end_date: ' +
+                              self._config['end_date'])
+            self._status = dataset_store.load_status(dataset_path)
+            return dataset_store.load(dataset_path)
         pickle_path = self._config['output_dir'] + 'daily.pickle'
         if os.path.exists(pickle_path):
             self._logger.info('Pickle file already exists for end_date: ' +
@@ -70,132 +180,411 @@ class HistoricalData(object):
         if not os.path.exists(self._config['output_dir']):
             os.makedirs(self._config['output_dir'])
 
-        # Holds raw data for scrape.
+        # Holds raw data for scrape. If streaming, raw data is instead parsed
+        # as soon as it arrives and only the parsed arrays are held.
         scrape_data = {}
+        frame_builder = None
+        if self._config.get('streaming', False):
+            frame_builder = ingest_utils.FrameBuilder()
+
+        # Find prior dataset to merge with if incremental.
+        prior_dir = None
+        if self._config.get('incremental', False):
+            prior_dir = self._find_prior_dir()
+            if prior_dir is None:
+                self._logger.info('No prior dataset found, scraping in full')
+            else:
+                self._logger.info('Merging with prior dataset: ' + prior_dir)
+
+        # Find raw data already stored in output_dir and prior_dir, which is
+        # only read when its symbol is reached.
+        active_symbols = self._read_shard_symbols()
+        existing_data = self._index_raw_data(self._config['output_dir'],
+                                             active_symbols)
+        prior_raw_data = {}
+        if prior_dir is not None:
+            prior_raw_data = self._index_raw_data(prior_dir, active_symbols)
+        raw_archive = None
+        if self._config.get('raw_storage', 'files') == 'packed':
+            raw_archive = packed_archive.PackedArchive(
+                self._config['output_dir'] + _RAW_ARCHIVE_NAME)
+
+        # Collect scrape tasks and populate data for existing raw data.
+        scrape_tasks = []
+        failed_symbols = set()
+        active_symbols = set(active_symbols)
+        for symbol_name in self._read_shard_symbols(include_skipped=True):
+            context = {'raw_archive': raw_archive,
+                       'scrape_data': scrape_data,
+                       'frame_builder': frame_builder,
+                       'failed_symbols': failed_symbols,
+                       'symbol_name': symbol_name}
+            if symbol_name not in active_symbols:
+                self._logger.info('Skipping symbol: ' + symbol_name)
+            elif symbol_name in existing_data:
+                self._logger.info('Raw data already exists: ' + symbol_name)
+                self._store_scrape(context, self._read_raw_data(
+                    existing_data[symbol_name]))
+            elif self._use_history_cache(context):
+                self._logger.info('History cache covers: ' + symbol_name)
+            else:
+                start_date = self._config['start_date']
+                prior_data = context.get('prior_data')
+                if prior_data is None and symbol_name in prior_raw_data:
+                    prior_data = self._get_prior_data(self._read_raw_data(
+                        prior_raw_data[symbol_name]))
+                if prior_data is not None:
+                    # Overlap one day to detect price adjustments.
+                    context['prior_data'] = prior_data
+                    start_date = self.get_csv_date_range(prior_data)[
+                        1].replace('-', '')
+                    if start_date >= self._config['end_date']:
+                        self._logger.info('Prior data covers: ' + symbol_name)
+                        self._store_scrape(context, self._write_raw_data(
+                            context, self.slice_csv(
+                                prior_data, context.get(
+                                    'cache_start_date', self._config[
+                                        'start_date']),
+                                self._config['end_date'])))
+                        continue
+                url = self.get_url(symbol_name, start_date,
+                                   self._config['end_date'], self._config.get(
+                                       'base_url', _BASE_URL))
+                scrape_tasks.append((url, context))
 
-        # Init tor_scraper, add scrape tasks, populate data for existing files.
-        scraper = tor_scraper.TorScraper(self._tor_scraper_config)
-        with open(self._config['symbols_file'], 'rb') as symbols_file:
-            csv_reader = csv.reader(symbols_file, delimiter=',')
-            for row in csv_reader:
-                symbol_name = row[1]
-                output_path = self._config['output_dir'] + symbol_name + '.csv'
-                if int(row[2]) == 0:
-                    self._logger.info('Skipping symbol: ' + symbol_name)
-                elif os.path.exists(output_path):
-                    self._logger.info('File already exists: ' + output_path)
-                    with open(output_path, 'rb') as output_file:
-                        scrape_data[symbol_name] = output_file.read()
-                else:
-                    url = self.get_url(symbol_name, self._config['start_date'],
-                                       self._config['end_date'])
-                    scraper.add_scrape(url, {'output_path': output_path,
-                                             'scrape_data': scrape_data,
-                                             'symbol_name': symbol_name},
-                                       self._scrape_handler)
-
-        # Start scraping, blocks until finished.
-        scraper.run()
-
-        # Get dataframes, write pickle if applicable, and return.
-        daily = self._build_dataframes(scrape_data)
+        # Start scraping, blocks until finished including any retries.
+        self._scrape(scrape_tasks, failed_symbols)
+
+        # Parse raw data if not already parsed while streaming, optionally
+        # across a pool of worker processes.
+        if frame_builder is not None:
+            parsed_data = frame_builder.get_parsed_data()
+        else:
+            self._logger.info('Parsing raw data')
+            start_time = time.time()
+            parsed_data = ingest_utils.parse_all(
+                scrape_data, self._config.get('ingest_process_count', 1))
+            self._logger.info('Parsed {} symbols in {:.3f}s'.format(
+                len(parsed_data), time.time() - start_time))
+            scrape_data.clear()
+
+        # Get dataframes, write dataset if applicable, and return.
+        daily = self._build_dataframes(parsed_data)
         if daily is not None:
-            with open(pickle_path, 'w') as output_file:
-                self._logger.info('Dumping dataframes to pickle file: ' +
-                                  pickle_path)
-                pickle.dump(daily, output_file)
+            self._logger.info('Saving dataframes to dataset: ' + dataset_path)
+            dataset_store.save(daily, dataset_path, self._status)
         return daily
 
-    def _build_dataframes(self, scrape_data):
-        """Validate and combine raw scrape data into dataframes.
+    def _scrape(self, scrape_tasks, failed_symbols):
+        """Runs scrape tasks, then re-queues failed symbols with exponential
+        backoff until they succeed or the retry config is exhausted, for at
+        most retry_count rounds after the first. Each round runs a new scraper,
+        but Tor processes are only killed, rotating circuits, when the failure
+        rate of a round reaches rotate_failure_rate.
+
+        Args:
+            scrape_tasks: List of (url, context) tuples.
+            failed_symbols: Set of symbols whose latest scrape failed, which is
+                updated by the scrape handler.
+        """
+        retry_config = self._config.get('retry_config', {})
+        retry_count = retry_config.get('retry_count', 0)
+        retry_budget = retry_config.get('budget', 0)
+        backoff_seconds = retry_config.get('backoff_seconds', 1.0)
+        rotate_failure_rate = retry_config.get('rotate_failure_rate', .5)
+
+        attempt = 0
+        while len(scrape_tasks) > 0:
+            scraper = self._create_scraper()
+            for url, context in scrape_tasks:
+                scraper.add_scrape(context.get('retry_url', url), context,
+                                   self._scrape_handler)
+            scraper.run()
+
+            failed_tasks = [x for x in scrape_tasks if x[1][
+                'symbol_name'] in failed_symbols]
+            if len(failed_tasks) == 0 or attempt >= retry_count or (
+                    retry_budget <= 0):
+                break
+            failure_rate = len(failed_tasks) / float(len(scrape_tasks))
+            scrape_tasks = failed_tasks[:retry_budget]
+            retry_budget -= len(scrape_tasks)
+            attempt += 1
+
+            delay = backoff_seconds * 2 ** (attempt - 1)
+            self._logger.warning('Retrying {} symbols in {:.1f}s, retry: {}'
+                                 .format(len(scrape_tasks), delay, attempt))
+            time.sleep(delay)
+            if failure_rate >= rotate_failure_rate:
+                self._logger.warning('Failure rate {:.2f}, rotating circuits'
+                                     .format(failure_rate))
+                self._rotate_circuits()
+
+    def _rotate_circuits(self):
+        """Kills any running Tor processes, so the next tor_scraper starts with
+        new circuits. Does nothing for other fetchers.
+        """
+        if self._config.get('fetcher', 'tor_scraper') != 'tor_scraper':
+            return
+        tor_cmd = self._tor_scraper_config.get('tor_cmd', 'tor')
+        subprocess.call(['pkill', os.path.basename(tor_cmd.split()[0])])
+
+    def _create_scraper(self):
+        """Creates the fetcher selected by config. Any fetcher must provide
+        add_scrape(url, context, handler) and a blocking run().
+        """
+        fetcher = self._config.get('fetcher', 'tor_scraper')
+        if fetcher == 'tor_scraper':
+            return tor_scraper.TorScraper(self._tor_scraper_config)
+        elif fetcher == 'http_fetcher':
+            return http_fetcher.HttpFetcher(self._http_fetcher_config or {})
+        raise ValueError('Unknown fetcher: ' + fetcher)
+
+    def _find_prior_dir(self):
+        """Find the most recent sibling of output_dir which sorts before it and
+        contains a complete dataset. Returns None if there is no such dir,
+        including if the parent of output_dir does not exist yet.
+        """
+        output_dir = os.path.normpath(self._config['output_dir'])
+        parent_dir = os.path.dirname(output_dir)
+        current_name = os.path.basename(output_dir)
+        if not os.path.isdir(parent_dir or '.'):
+            return None
+        for name in sorted(os.listdir(parent_dir or '.'), reverse=True):
+            prior_dir = os.path.join(parent_dir, name) + os.sep
+            if name < current_name and (dataset_store.exists(
+                    prior_dir + 'daily/') or os.path.exists(
+                        prior_dir + 'daily.pickle')):
+                return prior_dir
+        return None
+
+    def _use_history_cache(self, context):
+        """Stores data for a symbol from the history cache and returns True if
+        the cache covers start_date through end_date. Otherwise, if the cache
+        covers start_date, sets its data as prior_data in context so only the
+        missing dates are scraped.
+        """
+        if self._history_cache is None:
+            return False
+        cached = self._history_cache.get(context['symbol_name'])
+        if cached is None or cached[1] > self._config['start_date']:
+            return False
+        if cached[2] >= self._config['end_date']:
+            self._store_scrape(context, self.slice_csv(
+                cached[0], self._config['start_date'],
+                self._config['end_date']))
+            return True
+        context['prior_data'] = cached[0]
+        context['cache_start_date'] = cached[1]
+        return False
+
+    def _index_raw_data(self, directory, symbol_names):
+        """Finds raw data stored in a dir for the given symbols, in its packed
+        archive if it has one and otherwise in per-symbol CSV files. Returns a
+        dict keyed by symbol, which omits symbols with no stored data, of
+        locations to pass to _read_raw_data().
+        """
+        archive_path = directory + _RAW_ARCHIVE_NAME
+        if packed_archive.PackedArchive.exists(archive_path):
+            self._logger.info('Reading packed archive index: ' + archive_path)
+            archive = packed_archive.PackedArchive(archive_path)
+            index = archive.read_index()
+            return dict((x, (archive, index[x])) for x in symbol_names if (
+                x in index))
+
+        raw_data = {}
+        for symbol_name in symbol_names:
+            path = directory + symbol_name + '.csv'
+            if os.path.exists(path):
+                raw_data[symbol_name] = path
+        return raw_data
+
+    @staticmethod
+    def _read_raw_data(location):
+        """Reads the raw data of a symbol from a location returned by
+        _index_raw_data().
+        """
+        if isinstance(location, basestring):
+            with open(location, 'rb') as input_file:
+                return input_file.read()
+        archive, (offset, length) = location
+        return archive.read(offset, length)
+
+    def _get_prior_data(self, prior_data):
+        """Checks raw data for a symbol from a prior dataset. Returns None if
+        the prior data is invalid or does not cover start_date, in which case
+        the symbol must be scraped in full.
+        """
+        if not prior_data.startswith(_CSV_HEADER):
+            return None
+
+        # Allow a week of slack since start_date may not be a trading day.
+        date_range = self.get_csv_date_range(prior_data)
+        start_date = pd.to_datetime(self._config['start_date'])
+        if date_range[0] is None or pd.to_datetime(date_range[0]) > (
+                start_date + pd.Timedelta(days=7)):
+            return None
+        return prior_data
+
+    def _build_dataframes(self, parsed_data):
+        """Validate and combine parsed scrape data into dataframes.
         """
         # Create dataframes for prices and volume.
         self._logger.info('Creating dataframes')
+        start_time = time.time()
         is_valid = True
-        drop_columns = []
-        daily = {}
-        close = {}
-        adj_close = {}
-        volume = {}
-        for key, value in scrape_data.iteritems():
-            if value is None:
-                is_valid = False
-            else:
-                csv_data = pd.read_csv(io.StringIO(unicode(value)))
-                csv_data['Date'] = csv_data['Date'].apply(pd.to_datetime)
-                csv_data = csv_data.set_index('Date')
-                close[key] = csv_data['Close']
-                adj_close[key] = csv_data['Adj Close']
-                volume[key] = csv_data['Volume']
-
-        daily['close'] = pd.DataFrame(close).sort_index()
-        daily['adj_close'] = pd.DataFrame(adj_close).sort_index()
-        daily['volume'] = pd.DataFrame(volume).sort_index()
+        if any(x is None for x in parsed_data.itervalues()):
+            is_valid = False
+        daily = ingest_utils.build_frames(parsed_data)
+        self._logger.info('Created dataframes in {:.3f}s'.format(
+            time.time() - start_time))
 
         # Validate dataframes.
         self._logger.info('Validating dataframes')
+        start_time = time.time()
         end_date = pd.to_datetime(self._config['end_date'])
         if daily['close'].index.max() != end_date or (
                 daily['adj_close'].index.max() != end_date) or (
                     daily['volume'].index.max() != end_date):
             self._logger.error('End date mismatch')
             is_valid = False
-        if np.any(daily['close'].isnull()) or np.any(
-                daily['adj_close'].isnull()):
-            columns = daily['close'].columns[
-                daily['close'].isnull().any(axis=0)].values
-            columns = np.concatenate((columns, daily['adj_close'].columns[
-                daily['adj_close'].isnull().any(axis=0)].values))
-            drop_columns.extend(columns)
-            self._logger.error('Price data contains nulls: ' +
-                               ', '.join(columns))
-            is_valid = False
-        if np.any(daily['volume'].isnull()):
-            columns = daily['volume'].columns[
-                daily['volume'].isnull().any(axis=0)].values
-            drop_columns.extend(columns)
-            self._logger.error('Volume data contains nulls: ' +
-                               ', '.join(columns))
-            is_valid = False
-        if np.any(daily['volume'] == 0):
-            columns = daily['volume'].columns[
-                (daily['volume'] == 0).any(axis=0)].values
-            drop_columns.extend(columns)
-            self._logger.error('Volume data contains zeros: ' +
-                               ', '.join(columns))
-            is_valid = False
+        self._status = validation_utils.get_status(
+            daily, self._config['end_date'], self._config.get(
+                'validation_config'))
+        for flag, description in validation_utils.FLAGS:
+            columns = self._status.index[(self._status.values & flag) != 0]
+            if len(columns) == 0:
+                continue
+            if flag & validation_utils.DROP_MASK:
+                self._logger.error(description + ': ' + ', '.join(columns))
+                is_valid = False
+            else:
+                self._logger.warning(description + ': ' + ', '.join(columns))
 
         # If validation fails, log error and drop any responsible columns.
         if is_valid is False:
             self._logger.error('Dataframes validation failed')
-            if len(drop_columns) > 0:
-                self._logger.warning('Dropping columns: ' +
-                                     ', '.join(drop_columns))
-                daily['close'].drop(drop_columns, axis=1, inplace=True)
-                daily['adj_close'].drop(drop_columns, axis=1, inplace=True)
-                daily['volume'].drop(drop_columns, axis=1, inplace=True)
+            is_dropped = (self._status.values & validation_utils.DROP_MASK) != 0
+            if np.any(is_dropped):
+                self._logger.warning('Dropping columns: ' + ', '.join(
+                    self._status.index[is_dropped]))
+                for field in daily:
+                    daily[field] = daily[field].loc[:, ~is_dropped]
+        self._logger.info('Validated dataframes in {:.3f}s'.format(
+            time.time() - start_time))
 
         return daily
 
     def _scrape_handler(self, url, context, result):
-        """Stores the result of scrapes in memory and writes to file.
+        """Stores the result of scrapes in memory and writes to file. Returns
+        False if the result is invalid, so adaptive fetchers can count it as an
+        error.
         """
+        if self._recorder is not None and result is not None:
+            self._recorder.append(url, result)
+
         # Validate raw scrape data.
-        if not str(result).startswith(
-                'Date,Open,High,Low,Close,Volume,Adj Close'):
+        if not str(result).startswith(_CSV_HEADER):
             self._logger.error('Error scraping url: ' + url)
-            context['scrape_data'][context['symbol_name']] = None
-            return
+            self._store_scrape(context, None)
+            return False
 
-        output_path = context['output_path']
-        self._logger.info('Writing file: ' + output_path + ' for url: ' + url)
-        with open(output_path, 'w') as output_file:
-            output_file.write(result)
+        # Merge with prior data if this was an incremental scrape.
+        if 'prior_data' in context:
+            result = self.merge_csv(context['prior_data'], result, context.get(
+                'cache_start_date', self._config['start_date']))
+            if result is None:
+                self._logger.warning('No overlapping date for url: ' + url)
+                self._store_scrape(context, None)
+
+                # Any retry must scrape the full period instead.
+                del context['prior_data']
+                context.pop('cache_start_date', None)
+                context['retry_url'] = self.get_url(
+                    context['symbol_name'], self._config['start_date'],
+                    self._config['end_date'], self._config.get(
+                        'base_url', _BASE_URL))
+                return False
+
+        self._logger.info('Storing raw data for url: ' + url)
+        self._store_scrape(context, self._write_raw_data(context, result))
+        return True
+
+    def _write_raw_data(self, context, data):
+        """Writes raw data for a symbol through start_date, and returns the
+        data from start_date through end_date. Raw data goes to the history
+        cache if any, which holds history from before start_date, and otherwise
+        to output_dir.
+        """
+        if self._history_cache is not None:
+            self._history_cache.put(context['symbol_name'], data, (
+                context.get('cache_start_date', self._config['start_date'])), (
+                    self._config['end_date']))
+            return self.slice_csv(data, self._config['start_date'],
+                                  self._config['end_date'])
+        if context['raw_archive'] is not None:
+            context['raw_archive'].append(context['symbol_name'], data)
+        else:
+            output_path = (self._config['output_dir'] + context[
+                'symbol_name'] + '.csv')
+            with open(output_path, 'w') as output_file:
+                output_file.write(data)
+        return data
+
+    @staticmethod
+    def _store_scrape(context, data):
+        """Stores raw data for a symbol, or None if its scrape failed. If
+        streaming, data is parsed immediately and the raw data is not kept.
+        """
+        if data is None:
+            context['failed_symbols'].add(context['symbol_name'])
+        else:
+            context['failed_symbols'].discard(context['symbol_name'])
+        if context['frame_builder'] is not None:
+            context['frame_builder'].add(context['symbol_name'], data)
+        else:
+            context['scrape_data'][context['symbol_name']] = data
+
+    def _read_shard_symbols(self, include_skipped=False):
+        """Reads symbol names in order from symbols_file, keeping only those of
+        the shard given by shard_index if shard_count is set.
+        """
+        symbols = self.read_symbols(self._config['symbols_file'],
+                                    include_skipped)
+        if self._config.get('shard_count') is None:
+            return symbols
+        shard_symbols = set(self.read_symbols(
+            self._config['symbols_file'], include_skipped=True)[
+                self._config['shard_index']::self._config['shard_count']])
+        return [x for x in symbols if x in shard_symbols]
+
+    @staticmethod
+    def read_symbols(symbols_file, include_skipped=False):
+        """Reads symbol names in order from one or more symbols files, without
+        duplicates. A symbol is skipped only if every file marks it as skipped.
 
-        context['scrape_data'][context['symbol_name']] = result
+        Args:
+            symbols_file: Path of a symbols file, or a list of paths.
+            include_skipped: Whether to include symbols marked as skipped.
+        """
+        if isinstance(symbols_file, basestring):
+            symbols_file = [symbols_file]
+        symbols = []
+        seen_symbols = set()
+        active_symbols = set()
+        for path in symbols_file:
+            with open(path, 'rb') as input_file:
+                csv_reader = csv.reader(input_file, delimiter=',')
+                for row in csv_reader:
+                    if row[1] not in seen_symbols:
+                        symbols.append(row[1])
+                        seen_symbols.add(row[1])
+                    if int(row[2]) != 0:
+                        active_symbols.add(row[1])
+        return [x for x in symbols if include_skipped or x in active_symbols]
 
     @staticmethod
-    def get_url(symbol_name, start_date, end_date=None):
+    def get_url(symbol_name, start_date, end_date=None, base_url=_BASE_URL):
         """Builds the url to request data for the given symbol and time period.
         Uses dates of format YYYYMMDD.
 
@@ -203,9 +592,10 @@ class HistoricalData(object):
             symbol_name: The ticker symbol for this instrument.
             start_date: First date for which to request data.
             end_date: Last date for which to request data.
+            base_url: Url of the data source, e.g. a local replay_server.
         """
         start_date = start_date
-        url = 'http://real-chart.finance.yahoo.com/table.csv?ignore=.csv'
+        url = base_url + '?ignore=.csv'
         url += '&s=' + symbol_name
         url += '&a={}&b={}&c={}'.format(int(start_date[4:6]) - 1,
                                         start_date[6:],
@@ -216,3 +606,95 @@ class HistoricalData(object):
                                             end_date[6:],
                                             end_date[0:4])
         return url
+
+    @staticmethod
+    def get_csv_date_range(data):
+        """Returns the first and last dates as strings of format YYYY-MM-DD in
+        raw CSV data, or (None, None) if it contains no rows.
+
+        Args:
+            data: Raw CSV data with the header of a scrape.
+        """
+        dates = [x[:10] for x in data.splitlines()[1:] if x]
+        if len(dates) == 0:
+            return (None, None)
+        return (min(dates), max(dates))
+
+    @staticmethod
+    def slice_csv(data, start_date, end_date):
+        """Returns raw CSV data with only the rows from start_date through
+        end_date, of format YYYYMMDD.
+
+        Args:
+            data: Raw CSV data with the header of a scrape.
+            start_date: First date to keep.
+            end_date: Last date to keep.
+        """
+        start_date = '{}-{}-{}'.format(start_date[0:4], start_date[4:6],
+                                       start_date[6:])
+        end_date = '{}-{}-{}'.format(end_date[0:4], end_date[4:6], end_date[6:])
+        lines = data.splitlines()
+        return '\n'.join([lines[0]] + [x for x in lines[1:] if x and (
+            start_date <= x[:10] <= end_date)]) + '\n'
+
+    @staticmethod
+    def _get_ratio(new_value, prior_value):
+        """Returns the ratio of new to prior values of a CSV field, or None if
+        either is not a positive number.
+        """
+        try:
+            new_value = float(new_value)
+            prior_value = float(prior_value)
+        except ValueError:
+            return None
+        if not new_value > 0.0 or not prior_value > 0.0 or (
+                new_value == float('inf') or prior_value == float('inf')):
+            return None
+        return new_value / prior_value
+
+    @staticmethod
+    def merge_csv(prior_data, new_data, start_date):
+        """Merges raw CSV data from an incremental scrape into prior raw CSV
+        data. New rows take precedence, and rows before start_date are dropped.
+        Prices in prior rows are rescaled if the overlapping row shows that they
+        have since been adjusted for splits or dividends. If the overlapping
+        prices are zero or not numeric, no ratio can be found, and prior rows
+        are kept as they are. Returns None if there is no overlapping row to
+        check adjustments against.
+
+        Args:
+            prior_data: Raw CSV data from a prior scrape.
+            new_data: Raw CSV data scraped starting from the last prior date.
+            start_date: First date to keep, of format YYYYMMDD.
+        """
+        prior_rows = dict(
+            (x[:10], x) for x in prior_data.splitlines()[1:] if x)
+        new_rows = dict((x[:10], x) for x in new_data.splitlines()[1:] if x)
+        overlap_date = max(prior_rows)
+        if overlap_date not in new_rows:
+            return None
+
+        # Columns are Date,Open,High,Low,Close,Volume,Adj Close.
+        prior_values = prior_rows[overlap_date].split(',')
+        new_values = new_rows[overlap_date].split(',')
+        price_ratio = HistoricalData._get_ratio(new_values[4], prior_values[4])
+        adj_ratio = HistoricalData._get_ratio(new_values[6], prior_values[6])
+        if price_ratio is not None and adj_ratio is not None and (
+                price_ratio != 1.0 or adj_ratio != 1.0):
+            for key, value in prior_rows.iteritems():
+                values = value.split(',')
+                try:
+                    prices = [float(x) * price_ratio for x in values[1:5]]
+                    prior_rows[key] = ','.join(
+                        [values[0]] + ['{:.6f}'.format(x) for x in prices] + [
+                            '{:.0f}'.format(float(values[5]) / price_ratio),
+                            '{:.6f}'.format(float(values[6]) * adj_ratio)])
+                except (ValueError, IndexError):
+                    # Rows with null or missing fields are kept as they are.
+                    pass
+
+        prior_rows.update(new_rows)
+        start_date = '{}-{}-{}'.format(start_date[0:4], start_date[4:6],
+                                       start_date[6:])
+        return '\n'.join([_CSV_HEADER] + [prior_rows[x] for x in sorted(
+            prior_rows, reverse=True) if x >= start_date]) + '\n'
@@ -0,0 +1,172 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for historical_data.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+import historical_data
+import packed_archive
+
+class _FakeScraper(object):
+    """Records the urls it is asked to scrape, without scraping them.
+    """
+    def __init__(self):
+        self.urls = []
+
+    def add_scrape(self, url, context, handler):
+        self.urls.append(url)
+
+    def run(self):
+        pass
+
+class HistoricalDataTest(unittest.TestCase):
+    """Tests for the historical_data module.
+    """
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _get_data(self, output_dir):
+        """Returns a HistoricalData with trading_calendar set.
+        """
+        return historical_data.HistoricalData({
+            'symbols_file': 'universe_symbols.csv',
+            'output_dir': output_dir,
+            'start_date': '20150701',
+            'end_date': '20160128',
+            'trading_calendar': True,
+            'incremental': True,
+        }, {})
+
+    def test_has_new_session_without_parent_dir(self):
+        data = self._get_data(os.path.join(
+            self._temp_dir, 'universe_data', '20160128') + os.sep)
+        self.assertIsNone(data._find_prior_dir())
+        self.assertTrue(data.has_new_session())
+
+    def test_has_new_session_without_prior_dir(self):
+        os.makedirs(os.path.join(self._temp_dir, 'universe_data'))
+        data = self._get_data(os.path.join(
+            self._temp_dir, 'universe_data', '20160128') + os.sep)
+        self.assertIsNone(data._find_prior_dir())
+        self.assertTrue(data.has_new_session())
+
+    def test_merge_csv_rescales_prior_rows(self):
+        prior_data = (historical_data._CSV_HEADER + '\n'
+                      '2016-01-28,10,10,10,10,100,5\n'
+                      '2016-01-27,8,8,8,8,200,4\n')
+        new_data = (historical_data._CSV_HEADER + '\n'
+                    '2016-01-29,6,6,6,6,300,3\n'
+                    '2016-01-28,5,5,5,5,200,2.5\n')
+        merged = historical_data.HistoricalData.merge_csv(
+            prior_data, new_data, '20160101').splitlines()
+        self.assertEqual(merged[1:], [
+            '2016-01-29,6,6,6,6,300,3',
+            '2016-01-28,5,5,5,5,200,2.5',
+            '2016-01-27,4.000000,4.000000,4.000000,4.000000,400,2.000000'])
+
+    def test_merge_csv_without_ratio(self):
+        # Zero or null overlapping prices give no ratio, so nothing is rescaled.
+        for overlap_row in ['2016-01-28,0,0,0,0,100,0',
+                            '2016-01-28,null,null,null,null,null,null']:
+            prior_data = (historical_data._CSV_HEADER + '\n' + overlap_row +
+                          '\n2016-01-27,8,8,8,8,200,4\n')
+            new_data = (historical_data._CSV_HEADER + '\n'
+                        '2016-01-28,5,5,5,5,200,2.5\n')
+            merged = historical_data.HistoricalData.merge_csv(
+                prior_data, new_data, '20160101').splitlines()
+            self.assertEqual(merged[1:], ['2016-01-28,5,5,5,5,200,2.5',
+                                          '2016-01-27,8,8,8,8,200,4'])
+
+    def _get_daily_with_prior_data(self, raw_storage):
+        """Writes raw data covering every date to a prior dataset, then returns
+        the raw data and what get_daily() returns and scrapes for a later
+        output_dir.
+        """
+        symbols_path = os.path.join(self._temp_dir, 'symbols.csv')
+        with open(symbols_path, 'w') as symbols_file:
+            symbols_file.write('TEST CORP,TEST,1,\nOTHER CORP,OTHER,0,\n')
+        prior_dir = os.path.join(self._temp_dir, 'data', '20160128')
+        os.makedirs(prior_dir)
+        open(os.path.join(prior_dir, 'daily.pickle'), 'w').close()
+        rows = ['{},10,10,10,10,100,10'.format(x.strftime('%Y-%m-%d'))
+                for x in reversed(pd.bdate_range('20150701', '20160128'))]
+        raw_data = '\n'.join([historical_data._CSV_HEADER] + rows) + '\n'
+        if raw_storage == 'packed':
+            packed_archive.PackedArchive(os.path.join(prior_dir, (
+                historical_data._RAW_ARCHIVE_NAME))).append('TEST', raw_data)
+        else:
+            with open(os.path.join(prior_dir, 'TEST.csv'), 'w') as raw_file:
+                raw_file.write(raw_data)
+
+        output_dir = os.path.join(self._temp_dir, 'data', '20160129') + os.sep
+        data = historical_data.HistoricalData({
+            'symbols_file': symbols_path,
+            'output_dir': output_dir,
+            'start_date': '20150701',
+            'end_date': '20160128',
+            'incremental': True,
+            'raw_storage': raw_storage,
+        }, {})
+        scraper = _FakeScraper()
+        data._create_scraper = lambda: scraper
+        return raw_data, data.get_daily(), scraper.urls
+
+    def test_get_daily_skips_scrape_covered_by_prior_data(self):
+        raw_data, daily, urls = self._get_daily_with_prior_data('files')
+        self.assertEqual(urls, [])
+        self.assertEqual(len(daily['close']), len(raw_data.splitlines()) - 1)
+        with open(os.path.join(self._temp_dir, 'data', '20160129',
+                               'TEST.csv')) as raw_file:
+            self.assertEqual(raw_file.read(), raw_data)
+
+    def test_get_daily_reads_prior_packed_archive(self):
+        raw_data, daily, urls = self._get_daily_with_prior_data('packed')
+        self.assertEqual(urls, [])
+        self.assertEqual(len(daily['close']), len(raw_data.splitlines()) - 1)
+        self.assertEqual(packed_archive.PackedArchive(os.path.join(
+            self._temp_dir, 'data', '20160129', (
+                historical_data._RAW_ARCHIVE_NAME))).read_all(), {
+                    'TEST': raw_data})
+
+    def test_scrape_retries_with_new_scrapers(self):
+        data = historical_data.HistoricalData({
+            'fetcher': 'http_fetcher',
+            'retry_config': {
+                'retry_count': 2,
+                'budget': 10,
+                'backoff_seconds': 0,
+            },
+        }, {})
+        scrapers = []
+        def create_scraper():
+            scrapers.append(_FakeScraper())
+            return scrapers[-1]
+        data._create_scraper = create_scraper
+        failed_symbols = set(['TEST'])
+        data._scrape([('url', {'symbol_name': 'TEST'})], failed_symbols)
+        self.assertEqual([x.urls for x in scrapers], [['url']] * 3)
+
+if __name__ == '__main__':
+    unittest.main()
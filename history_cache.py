@@ -0,0 +1,158 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""HistoryCache is a content-addressed store of raw daily history per symbol,
+shared across output dirs and configs. A symbol's rows are split into one chunk
+per calendar month, and each chunk is stored once under the SHA-1 of its
+content, so unchanged months are shared by every version of a symbol's history
+that contains them. Each symbol has an index listing its chunks and the date
+range its history covers, i.e. the range which was actually scraped, which may
+include dates with no rows such as weekends.
+
+Layout under cache_dir:
+    objects/<sha1[:2]>/<sha1>: zlib-compressed CSV rows without header.
+    symbols/<symbol>.json: {'header', 'start_date', 'end_date', 'chunks'}.
+
+Chunks replaced by newer versions, e.g. after a dividend adjusts prices, are
+left behind until collect_garbage() is called.
+
+Example:
+    import history_cache
+    cache = history_cache.HistoryCache('history_cache/')
+    cache.put('SPY', raw_data, '20150701', '20160115')
+    raw_data, start_date, end_date = cache.get('SPY')
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+class HistoryCache(object):
+    """Contains all functionality for the history_cache module.
+    """
+    def __init__(self, cache_dir):
+        """HistoryCache must be initialized with args similar to those shown in
+        the example at the top of this file.
+
+        Args:
+            cache_dir: Directory of the cache, created if it does not exist.
+        """
+        self._objects_dir = os.path.join(cache_dir, 'objects')
+        self._symbols_dir = os.path.join(cache_dir, 'symbols')
+        for directory in (self._objects_dir, self._symbols_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def get(self, symbol_name):
+        """Returns a tuple (data, start_date, end_date) of the raw CSV data for
+        a symbol with header, and the range of dates it covers, of format
+        YYYYMMDD. Returns None if the symbol is not cached.
+
+        Args:
+            symbol_name: The ticker symbol for this instrument.
+        """
+        index = self._read_index(symbol_name)
+        if index is None:
+            return None
+        lines = [str(index['header'])]
+        for _, object_name in sorted(index['chunks'], reverse=True):
+            with open(self._get_object_path(object_name), 'rb') as input_file:
+                lines.append(zlib.decompress(input_file.read()))
+        return ('\n'.join(lines) + '\n', str(index['start_date']),
+                str(index['end_date']))
+
+    def put(self, symbol_name, data, start_date, end_date):
+        """Stores raw CSV data for a symbol, replacing any cached history.
+
+        Args:
+            symbol_name: The ticker symbol for this instrument.
+            data: Raw CSV data with header, in descending order of date.
+            start_date: First date covered by data, of format YYYYMMDD.
+            end_date: Last date covered by data, of format YYYYMMDD.
+        """
+        lines = data.splitlines()
+        months = {}
+        for line in lines[1:]:
+            if line:
+                months.setdefault(line[:7], []).append(line)
+
+        chunks = []
+        for month, month_lines in months.iteritems():
+            chunk = '\n'.join(sorted(month_lines, reverse=True))
+            object_name = hashlib.sha1(chunk).hexdigest()
+            object_path = self._get_object_path(object_name)
+            if not os.path.exists(object_path):
+                self._write_atomic(object_path, zlib.compress(chunk))
+            chunks.append([month, object_name])
+
+        self._write_atomic(self._get_index_path(symbol_name), json.dumps({
+            'header': lines[0],
+            'start_date': start_date,
+            'end_date': end_date,
+            'chunks': sorted(chunks),
+        }))
+
+    def collect_garbage(self):
+        """Deletes chunks no longer referenced by any symbol. Must not run
+        concurrently with put().
+        """
+        referenced = set()
+        for name in os.listdir(self._symbols_dir):
+            if name.endswith('.json'):
+                index = self._read_index(name[:-len('.json')])
+                referenced.update(x[1] for x in index['chunks'])
+        for prefix in os.listdir(self._objects_dir):
+            for name in os.listdir(os.path.join(self._objects_dir, prefix)):
+                if name not in referenced:
+                    os.remove(os.path.join(self._objects_dir, prefix, name))
+
+    def _read_index(self, symbol_name):
+        """Returns the index for a symbol, or None if it is not cached.
+        """
+        index_path = self._get_index_path(symbol_name)
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, 'rb') as input_file:
+            return json.loads(input_file.read())
+
+    def _get_index_path(self, symbol_name):
+        """Returns the path of the index for a symbol.
+        """
+        return os.path.join(self._symbols_dir, symbol_name + '.json')
+
+    def _get_object_path(self, object_name):
+        """Returns the path of a chunk, creating its parent dir if needed.
+        """
+        object_dir = os.path.join(self._objects_dir, object_name[:2])
+        if not os.path.exists(object_dir):
+            try:
+                os.makedirs(object_dir)
+            except OSError:
+                if not os.path.isdir(object_dir):
+                    raise
+        return os.path.join(object_dir, object_name)
+
+    @staticmethod
+    def _write_atomic(path, data):
+        """Writes a file via a temporary file and rename, so readers and other
+        threads never see it partially written.
+        """
+        temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(),
+                                          threading.current_thread().ident)
+        with open(temp_path, 'wb') as output_file:
+            output_file.write(data)
+        os.rename(temp_path, path)
@@ -0,0 +1,220 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""HttpFetcher fetches urls directly over pooled keep-alive HTTP connections.
+It is a drop-in alternative to tor_scraper.TorScraper with the same
+add_scrape() and run() contract, for sources which do not need Tor.
+
+Many requests are kept in flight by a pool of worker threads, which spend
+nearly all of their time waiting on sockets. Connections are reused across
+requests to the same host, and the number of requests in flight to any one host
+is capped separately from the total. If adaptive_concurrency is set, the total
+in flight adapts between its bounds (see concurrency_controller), and a handler
+may return False to report an invalid response as an error. A request counts
+against the adaptive limit, and its latency is timed, only from when it holds a
+slot for its host until its response is read, and the limit never exceeds
+per_host_limit times the number of hosts. Only http_fetcher adapts; tor_scraper
+always runs thread_count requests.
+
+Example:
+    import http_fetcher
+    fetcher = http_fetcher.HttpFetcher({
+        'concurrency': 100,
+        'per_host_limit': 20,
+        'timeout': 30,
+        'adaptive_concurrency': {  # Optional.
+            'min_concurrency': 2,
+            'max_concurrency': 200,
+            'initial_concurrency': 10,
+        },
+    })
+    fetcher.add_scrape('http://localhost:8000/table.csv?s=SPY', {},
+                       lambda url, context, result: None)
+    fetcher.run()  # Blocks until all handlers have been called.
+"""
+
+import httplib
+import logging
+import Queue
+import socket
+import threading
+import urlparse
+
+import concurrency_controller
+
+class HttpFetcher(object):
+    """Contains all functionality for the http_fetcher module.
+    """
+    def __init__(self, config):
+        """HttpFetcher must be initialized with args similar to those shown in
+        the example at the top of this file.
+
+        Args:
+            config: Determines the behavior of this instance.
+        """
+        self._config = config
+        self._logger = logging.getLogger(__name__)
+        self._scrapes = []
+        self._lock = threading.Lock()
+        self._idle_connections = {}
+        self._host_semaphores = {}
+        self._controller = None
+        if 'adaptive_concurrency' in config:
+            self._controller = concurrency_controller.ConcurrencyController(
+                config['adaptive_concurrency'])
+
+    def add_scrape(self, url, context, handler):
+        """Adds a url to be fetched by the next call to run().
+
+        Args:
+            url: Url to fetch with a GET request.
+            context: Passed through to handler.
+            handler: Function called as handler(url, context, result), where
+                result is the response body, or None if the request failed. It
+                may return False if the result is invalid.
+        """
+        self._scrapes.append((url, context, handler))
+
+    def run(self):
+        """Fetches all urls added since the last call to run(), and blocks until
+        all handlers have been called. Handlers are called from worker threads.
+        """
+        scrape_queue = Queue.Queue()
+        for scrape in self._scrapes:
+            scrape_queue.put(scrape)
+        self._scrapes = []
+
+        thread_count = self._config.get('concurrency', 100)
+        if self._controller is not None:
+            host_count = len(set(self._get_host_key(x[0]) for x in (
+                scrape_queue.queue)))
+            thread_count = min(self._config['adaptive_concurrency'].get(
+                'max_concurrency', 100), self._config.get(
+                    'per_host_limit', 20) * max(1, host_count))
+            self._controller.set_max_concurrency(thread_count)
+        threads = [threading.Thread(target=self._work, args=(scrape_queue,))
+                   for _ in range(min(thread_count, scrape_queue.qsize()))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _work(self, scrape_queue):
+        """Fetches urls from the queue until it is empty.
+        """
+        while True:
+            try:
+                url, context, handler = scrape_queue.get_nowait()
+            except Queue.Empty:
+                return
+            # Wait for a slot for the host before the adaptive limit, so only
+            # requests actually sent are counted and timed. Slots are freed
+            # before the handler runs, and an invalid result is reported after.
+            host_semaphore = self._get_host_semaphore(self._get_host_key(url))
+            with host_semaphore:
+                if self._controller is not None:
+                    start_time = self._controller.acquire()
+                result = None
+                try:
+                    result = self._fetch(url)
+                except Exception:
+                    self._logger.exception('Error fetching url: ' + url)
+                finally:
+                    if self._controller is not None:
+                        self._controller.release(start_time, result is None)
+            try:
+                is_valid = handler(url, context, result) is not False
+            except Exception:
+                self._logger.exception('Error in handler for url: ' + url)
+                is_valid = False
+            if self._controller is not None and result is not None and (
+                    not is_valid):
+                self._controller.report_error(start_time)
+
+    def get_concurrency(self):
+        """Returns the current limit on requests in flight.
+        """
+        if self._controller is not None:
+            return self._controller.get_limit()
+        return self._config.get('concurrency', 100)
+
+    @staticmethod
+    def _get_host_key(url):
+        """Returns the (scheme, host) a url is fetched from.
+        """
+        parts = urlparse.urlsplit(url)
+        return (parts.scheme, parts.netloc)
+
+    def _fetch(self, url):
+        """Returns the response body for a url, or None if the request failed.
+        Must be called holding the semaphore for its host. A request on a
+        reused connection is retried once on a new connection, since the server
+        may have closed it while idle.
+        """
+        parts = urlparse.urlsplit(url)
+        host_key = self._get_host_key(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        for is_reused in (True, False):
+            connection = self._get_connection(host_key, is_reused)
+            if connection is None:
+                continue
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error) as error:
+                connection.close()
+                if is_reused:
+                    continue
+                self._logger.error('Error fetching url: {} {}'.format(
+                    url, error))
+                return None
+
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    self._idle_connections[host_key].append(connection)
+            if response.status != httplib.OK:
+                self._logger.error('Status {} fetching url: {}'.format(
+                    response.status, url))
+                return None
+            return body
+
+    def _get_host_semaphore(self, host_key):
+        """Returns the semaphore limiting requests in flight to a host.
+        """
+        with self._lock:
+            if host_key not in self._host_semaphores:
+                self._host_semaphores[host_key] = threading.BoundedSemaphore(
+                    self._config.get('per_host_limit', 20))
+                self._idle_connections[host_key] = []
+            return self._host_semaphores[host_key]
+
+    def _get_connection(self, host_key, is_reused):
+        """Returns an idle connection to a host if is_reused, otherwise a new
+        connection. Returns None if is_reused and there are no idle connections.
+        """
+        if is_reused:
+            with self._lock:
+                if len(self._idle_connections[host_key]) == 0:
+                    return None
+                return self._idle_connections[host_key].pop()
+
+        connection_class = httplib.HTTPSConnection if (
+            host_key[0] == 'https') else httplib.HTTPConnection
+        return connection_class(host_key[1], timeout=self._config.get(
+            'timeout', 30))
@@ -0,0 +1,156 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for http_fetcher.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import threading
+import time
+import unittest
+
+import http_fetcher
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves every request after a short delay, recording the most requests
+    ever in flight and the number of connections accepted.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('localhost', 0), _Handler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connection_count = 0
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles a single request to _Server.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight,
+                                            self.server.in_flight)
+        time.sleep(.002)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write('ok')
+
+    def log_message(self, format, *args):
+        pass
+
+class HttpFetcherTest(unittest.TestCase):
+    """Tests for the http_fetcher module.
+    """
+    def setUp(self):
+        self._server = _Server()
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def _get_adaptive_config(per_host_limit):
+        """Returns an http_fetcher config with adaptive concurrency.
+        """
+        return {
+            'per_host_limit': per_host_limit,
+            'adaptive_concurrency': {
+                'min_concurrency': 2,
+                'max_concurrency': 200,
+                'initial_concurrency': 10,
+            },
+        }
+
+    def _fetch_all(self, config, request_count):
+        """Fetches request_count urls from the server and returns the fetcher
+        and the limits seen by handlers, which all check their result.
+        """
+        fetcher = http_fetcher.HttpFetcher(config)
+        limits = []
+        url = 'http://localhost:{}/table.csv?s={{}}'.format(
+            self._server.server_address[1])
+        def handler(url, context, result):
+            self.assertEqual(result, 'ok')
+            limits.append(fetcher.get_concurrency())
+        for i in range(request_count):
+            fetcher.add_scrape(url.format(i), {}, handler)
+        fetcher.run()
+        return fetcher, limits
+
+    def test_limit_capped_by_per_host_limit(self):
+        fetcher, limits = self._fetch_all(self._get_adaptive_config(5), 300)
+        self.assertEqual(len(limits), 300)
+        self.assertLessEqual(max(limits), 5)
+        self.assertLessEqual(fetcher.get_concurrency(), 5)
+        self.assertLessEqual(self._server.max_in_flight, 5)
+
+    def test_limit_below_per_host_limit_adapts(self):
+        fetcher, limits = self._fetch_all(self._get_adaptive_config(500),
+                                         300)
+        self.assertEqual(len(limits), 300)
+        self.assertLessEqual(max(limits), 200)
+        self.assertGreater(fetcher.get_concurrency(), 10)
+
+    def test_connections_reused(self):
+        _, limits = self._fetch_all({'concurrency': 4, 'per_host_limit': 4},
+                                    40)
+        self.assertEqual(len(limits), 40)
+        self.assertLessEqual(self._server.connection_count, 4)
+
+    def test_in_flight_capped_by_per_host_limit(self):
+        _, limits = self._fetch_all({'concurrency': 50, 'per_host_limit': 3},
+                                    40)
+        self.assertEqual(len(limits), 40)
+        self.assertLessEqual(self._server.max_in_flight, 3)
+        self.assertLessEqual(self._server.connection_count, 3)
+
+    def test_error_does_not_leak_slot(self):
+        # The bad port raises while the only slot is held, which would block
+        # the fetches after it if the slot were not freed.
+        fetcher = http_fetcher.HttpFetcher({
+            'concurrency': 1,
+            'adaptive_concurrency': {
+                'min_concurrency': 1,
+                'max_concurrency': 1,
+            },
+        })
+        results = []
+        for url in ['http://localhost:bad/'] + ['http://localhost:{}/'.format(
+                self._server.server_address[1])] * 3:
+            fetcher.add_scrape(url, {}, lambda *args: results.append(args[2]))
+        thread = threading.Thread(target=fetcher.run)
+        thread.daemon = True
+        thread.start()
+        thread.join(10)
+        self.assertEqual(results, [None, 'ok', 'ok', 'ok'])
+
+if __name__ == '__main__':
+    unittest.main()
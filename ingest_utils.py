@@ -0,0 +1,133 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Contains util functions for parsing raw CSV scrape data into numpy arrays and
+aligning them into dataframes. Only the columns used by reports are parsed, and
+dates are parsed in bulk using the fixed format of the data source.
+"""
+
+import io
+import multiprocessing
+import threading
+
+import numpy as np
+import pandas as pd
+
+_DATE_FORMAT = '%Y-%m-%d'
+_COLUMNS = ['Date', 'Close', 'Adj Close', 'Volume']
+_FIELDS = ('close', 'adj_close', 'volume')
+
+def parse_csv(data):
+    """Parses raw CSV data into a tuple of numpy arrays (dates, close,
+    adj_close, volume) sorted by date in ascending order. Dates are int64
+    nanoseconds since epoch.
+
+    Args:
+        data: Raw CSV data with the header of a scrape.
+    """
+    csv_data = pd.read_csv(io.BytesIO(data), usecols=_COLUMNS, dtype={
+        'Close': np.float64, 'Adj Close': np.float64, 'Volume': np.float64})
+    dates = pd.to_datetime(csv_data['Date'], format=_DATE_FORMAT).values.view(
+        np.int64)
+    order = np.argsort(dates, kind='mergesort')
+    return (dates[order], csv_data['Close'].values[order],
+            csv_data['Adj Close'].values[order],
+            csv_data['Volume'].values[order])
+
+def _parse_item(item):
+    """Parses a (key, data) item, passing through None data. Defined at module
+    level so that it can be sent to worker processes.
+    """
+    return (item[0], None if item[1] is None else parse_csv(item[1]))
+
+def parse_all(scrape_data, process_count=1):
+    """Parses raw CSV data for many symbols, optionally across a pool of worker
+    processes. Returns a dict of the same keys with values of the type returned
+    by parse_csv(), or None where the raw data was None.
+
+    Args:
+        scrape_data: dict of raw CSV data keyed by symbol.
+        process_count: Number of worker processes. If 1, parse serially in
+            this process.
+    """
+    if process_count <= 1 or len(scrape_data) <= 1:
+        return dict(_parse_item(x) for x in scrape_data.iteritems())
+
+    pool = multiprocessing.Pool(process_count)
+    try:
+        chunk_size = max(1, len(scrape_data) // (process_count * 4))
+        return dict(pool.imap_unordered(_parse_item, scrape_data.iteritems(),
+                                        chunk_size))
+    finally:
+        pool.close()
+        pool.join()
+
+def build_frames(parsed_data):
+    """Aligns parsed data for many symbols on a single sorted grid of all dates
+    and returns a dict of pandas.DataFrame keyed by field, with columns sorted
+    by symbol. Missing values are NaN. Symbols with None data are skipped.
+
+    Values are placed directly into one preallocated array per field, and the
+    dataframes wrap those arrays without copying.
+
+    Args:
+        parsed_data: dict of the type returned by parse_all().
+    """
+    symbols = sorted(x for x in parsed_data if parsed_data[x] is not None)
+    if len(symbols) > 0:
+        grid = np.unique(np.concatenate([parsed_data[x][0] for x in symbols]))
+    else:
+        grid = np.array([], dtype=np.int64)
+    dates = pd.DatetimeIndex(grid.view('datetime64[ns]'), name='Date')
+
+    # Arrays are (symbols, dates) so that each symbol is written contiguously.
+    # Their transposes are the (dates, symbols) layout pandas stores natively.
+    values = [np.full((len(symbols), grid.size), np.nan) for _ in _FIELDS]
+    for i, symbol in enumerate(symbols):
+        rows = np.searchsorted(grid, parsed_data[symbol][0])
+        for j in range(len(_FIELDS)):
+            values[j][i, rows] = parsed_data[symbol][j + 1]
+
+    return dict((x, pd.DataFrame(values[i].T, index=dates, columns=symbols,
+                                 copy=False)) for i, x in enumerate(_FIELDS))
+
+class FrameBuilder(object):
+    """Accumulates parsed data for symbols as raw CSV data arrives, so that
+    parsing overlaps with scraping and raw data can be released right away.
+    Safe to use from multiple threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._parsed_data = {}
+
+    def add(self, key, data):
+        """Parses and stores raw CSV data for a symbol, replacing any previous
+        data for it.
+
+        Args:
+            key: Symbol name.
+            data: Raw CSV data with the header of a scrape, or None if the
+                scrape failed.
+        """
+        parsed = None if data is None else parse_csv(data)
+        with self._lock:
+            self._parsed_data[key] = parsed
+
+    def get_parsed_data(self):
+        """Returns a dict of the type returned by parse_all() for all symbols
+        added so far.
+        """
+        with self._lock:
+            return dict(self._parsed_data)
@@ -19,13 +19,31 @@
 defaults to using the config specified in config.yaml, but this and the config
 for historical data can be overridden with command line args.
 
+If the config contains report_config_files, all of those reports are created
+from a single dataset, which holds the union of their symbols over the widest
+date range of their historical_data_configs. Each report receives a slice with
+only its own symbols and dates. The historical_data_config of the config itself
+provides output_dir and any other shared settings. Of the symbols and dates,
+only --end_date can be overridden, and it applies to every report.
+
+The universe report of a config without report_config_files can be split into
+shards of its symbols. Each shard is run with --shard_index, and writes a
+partial report to shard_dir instead of sending one, keeping its data under a dir
+of its own next to output_dir. A coordinator run with --merge_shards merges the
+partials of all shards and sends the report.
+
 Example:
     ./main.py --config_file custom_config.yaml
+    ./main.py --config_file universe_config.yaml --shard_index 0 \\
+        --shard_count 4 --shard_dir universe_data/shards/
+    ./main.py --config_file universe_config.yaml --merge_shards \\
+        --shard_count 4 --shard_dir universe_data/shards/
 """
 
 import argparse
 import logging
 import logging.config
+import os
 import sys
 
 import yaml
@@ -50,11 +68,29 @@ def main():
         'historical_data_config start_date'))
     parser.add_argument('--end_date', metavar='YYYYMMDD', help=(
         'historical_data_config end_date'))
+    parser.add_argument('--shard_index', type=int, help=(
+        'shard of universe symbols to run'))
+    parser.add_argument('--shard_count', type=int, help=(
+        'number of shards of universe symbols'))
+    parser.add_argument('--shard_dir', metavar='DIR', help=(
+        'dir of partial reports of shards'))
+    parser.add_argument('--merge_shards', action='store_true', help=(
+        'merge partial reports of all shards and send the report'))
     args = parser.parse_args()
+    if args.shard_count is not None and (args.shard_dir is None or (
+            args.shard_index is None and not args.merge_shards)):
+        parser.error('--shard_count requires --shard_dir and either '
+                     '--shard_index or --merge_shards')
 
     # Load config and overwrite any values set by optional command line args.
     with open(args.config_file, 'r') as config_file:
         config = yaml.load(config_file.read())
+    if 'report_config_files' in config and (
+            args.symbols_file is not None or args.start_date is not None):
+        parser.error('--symbols_file and --start_date cannot be used with '
+                     'report_config_files, set them in each report config')
+    if 'report_config_files' in config and args.shard_count is not None:
+        parser.error('--shard_count cannot be used with report_config_files')
     if args.symbols_file is not None:
         config['historical_data_config']['symbols_file'] = args.symbols_file
     if args.output_dir is not None:
@@ -68,22 +104,172 @@ def main():
     logging.config.dictConfig(config['logging_config'])
     logger = logging.getLogger(__name__)
 
+    # Merge and send partial reports of shards without getting data.
+    if args.merge_shards:
+        merge_shards(config, args.shard_count, args.shard_dir)
+        return
+    if args.shard_count is not None:
+        set_shard(config, args.shard_index, args.shard_count)
+        shard_data_dir = os.path.dirname(os.path.normpath(config[
+            'historical_data_config']['output_dir']))
+        if shard_data_dir and not os.path.exists(shard_data_dir):
+            os.makedirs(shard_data_dir)
+
+    # If multiple reports, combine their historical_data_configs.
+    report_configs = [config]
+    if 'report_config_files' in config:
+        report_configs = []
+        for path in config['report_config_files']:
+            with open(path, 'r') as report_config_file:
+                report_configs.append(yaml.load(report_config_file.read()))
+            if args.end_date is not None:
+                report_configs[-1]['historical_data_config']['end_date'] = (
+                    args.end_date)
+        report_data_configs = [
+            x['historical_data_config'] for x in report_configs]
+        config['historical_data_config'].update({
+            'symbols_file': [x['symbols_file'] for x in report_data_configs],
+            'start_date': min(x['start_date'] for x in report_data_configs),
+            'end_date': max(x['end_date'] for x in report_data_configs)})
+
     # Get daily historical data.
     data = historical_data.HistoricalData(config['historical_data_config'],
-                                          config['tor_scraper_config'])
+                                          config['tor_scraper_config'],
+                                          config.get('http_fetcher_config'))
+    if not data.has_new_session():
+        logger.info('No new trading session, skipping run')
+        return
     daily = data.get_daily()
     if daily is None:
         logger.error('No daily dataframe')
         sys.exit(1)
 
-    # If respective configs exist, create and send email reports.
+    if args.shard_count is not None:
+        if not os.path.exists(args.shard_dir):
+            os.makedirs(args.shard_dir)
+        partial = universe_report.UniverseReport(config[
+            'universe_report_config'], daily).get_partial()
+        universe_report.save_partial(partial, get_partial_path(
+            args.shard_dir, args.shard_index, args.shard_count))
+        return
+
+    for report_config in report_configs:
+        report_daily = daily
+        if report_config is not config:
+            report_daily = slice_daily(daily, report_config[
+                'historical_data_config'])
+        send_reports(report_config, report_daily)
+
+def get_shard_path(path, shard_index, shard_count):
+    """Returns the path used by a shard in place of a path shared by all, which
+    has a dir for the shard inserted before its last component.
+
+    Args:
+        path: Path of a file or dir.
+        shard_index: Index of the shard.
+        shard_count: Number of shards.
+    """
+    path = os.path.normpath(path)
+    return os.path.join(os.path.dirname(path), 'shard_{}_of_{}'.format(
+        shard_index, shard_count), os.path.basename(path))
+
+def get_partial_path(shard_dir, shard_index, shard_count):
+    """Returns the path of the partial report of a shard.
+
+    Args:
+        shard_dir: Dir of partial reports of shards.
+        shard_index: Index of the shard.
+        shard_count: Number of shards.
+    """
+    return os.path.join(shard_dir, 'shard_{}_of_{}.pickle'.format(
+        shard_index, shard_count))
+
+def set_shard(config, shard_index, shard_count):
+    """Updates a config so only the symbols of one shard are scraped, and its
+    data and rolling state are kept apart from those of other shards.
+
+    Args:
+        config: Config with historical_data_config and universe_report_config.
+        shard_index: Index of the shard.
+        shard_count: Number of shards.
+    """
+    data_config = config['historical_data_config']
+    data_config['shard_index'] = shard_index
+    data_config['shard_count'] = shard_count
+    data_config['output_dir'] = get_shard_path(
+        data_config['output_dir'], shard_index, shard_count) + os.sep
+    report_config = config['universe_report_config']
+    if 'rolling_state_file' in report_config:
+        report_config['rolling_state_file'] = get_shard_path(
+            report_config['rolling_state_file'], shard_index, shard_count)
+
+def merge_shards(config, shard_count, shard_dir):
+    """Merges the partial reports of all shards, then creates and sends the
+    universe report.
+
+    Args:
+        config: Config with universe_report_config and emailer_config.
+        shard_count: Number of shards.
+        shard_dir: Dir of partial reports of shards.
+    """
+    logger = logging.getLogger(__name__)
+    paths = [get_partial_path(shard_dir, x, shard_count) for x in range(
+        shard_count)]
+    missing_paths = [x for x in paths if not os.path.exists(x)]
+    if missing_paths:
+        logger.error('Missing partial reports: ' + ', '.join(missing_paths))
+        sys.exit(1)
+    partial = universe_report.merge_partials([
+        universe_report.load_partial(x) for x in paths])
+    universe = universe_report.format_report(config['universe_report_config'],
+                                             partial)
+    sender = emailer.Emailer(config['emailer_config'])
+    sender.send(subject=universe['subject'], message_parts={
+        'plain_body': universe['plain_body']})
+
+def slice_daily(daily, historical_data_config):
+    """Slices daily dataframes to the symbols and date range of the given
+    historical_data_config. Rows are sliced as views, and columns are only
+    selected if they differ.
+
+    Args:
+        daily: dict of pandas.DataFrame of the type returned by
+            historical_data.get_daily().
+        historical_data_config: Config with symbols_file, start_date and
+            end_date.
+    """
+    symbols = historical_data.HistoricalData.read_symbols(
+        historical_data_config['symbols_file'])
+    sliced_daily = {}
+    for key, value in daily.iteritems():
+        value = value.loc[historical_data_config['start_date']:(
+            historical_data_config['end_date'])]
+        columns = [x for x in symbols if x in value.columns]
+        if columns != list(value.columns):
+            value = value[columns]
+        sliced_daily[key] = value
+    return sliced_daily
+
+def send_reports(config, daily):
+    """Creates and sends email reports for each report config that exists.
+
+    Args:
+        config: Config which may contain portfolio_report_config, or a list of
+            them which are evaluated together, and universe_report_config.
+        daily: dict of pandas.DataFrame of the type returned by
+            historical_data.get_daily().
+    """
     if 'portfolio_report_config' in config:
-        portfolio = portfolio_report.PortfolioReport(
-            config['portfolio_report_config'], daily).get_report()
-        sender = emailer.Emailer(config['emailer_config'])
-        sender.send(subject=portfolio['subject'], message_parts={
-            'plain_body': portfolio['plain_body'],
-            'files': portfolio['files']})
+        portfolio_configs = config['portfolio_report_config']
+        if not isinstance(portfolio_configs, list):
+            portfolio_configs = [portfolio_configs]
+        for report in portfolio_report.PortfolioReport.create_batch(
+                portfolio_configs, daily):
+            portfolio = report.get_report()
+            sender = emailer.Emailer(config['emailer_config'])
+            sender.send(subject=portfolio['subject'], message_parts={
+                'plain_body': portfolio['plain_body'],
+                'files': portfolio['files']})
     if 'universe_report_config' in config:
         universe = universe_report.UniverseReport(
             config['universe_report_config'], daily).get_report()
@@ -0,0 +1,154 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for main.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import yaml
+
+import emailer
+import historical_data
+import main
+import universe_report
+
+class _FakeEmailer(object):
+    """Records sent messages instead of sending them.
+    """
+    sent = []
+
+    def __init__(self, config):
+        pass
+
+    def send(self, subject, message_parts):
+        _FakeEmailer.sent.append((subject, message_parts['plain_body']))
+
+class MainTest(unittest.TestCase):
+    """Tests for the main module.
+    """
+    _SYMBOLS = ['S{:02d}'.format(x) for x in range(12)]
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._argv = sys.argv
+        self._get_daily = historical_data.HistoricalData.get_daily
+        self._emailer = emailer.Emailer
+        _FakeEmailer.sent = []
+        emailer.Emailer = _FakeEmailer
+
+        # Each shard gets the columns of its own symbols from one dataset.
+        random = np.random.RandomState(0)
+        dates = pd.bdate_range('20150101', '20160128', name='Date')
+        shape = (dates.size, len(self._SYMBOLS))
+        self._daily = {
+            'adj_close': pd.DataFrame(50.0 * np.cumprod(1.0 + (
+                .02 * random.randn(*shape)), axis=0), index=dates,
+                                      columns=self._SYMBOLS),
+            'volume': pd.DataFrame(random.randint(1, 10 ** 6, shape).astype(
+                float), index=dates, columns=self._SYMBOLS),
+        }
+        daily = self._daily
+
+        def get_daily(data):
+            symbols = sorted(data._read_shard_symbols())
+            return dict((x, y[symbols]) for x, y in daily.iteritems())
+        historical_data.HistoricalData.get_daily = get_daily
+
+        self._symbols_file = os.path.join(self._temp_dir, 'symbols.csv')
+        with open(self._symbols_file, 'wb') as output_file:
+            output_file.write(''.join('Test,{},1\n'.format(x) for x in (
+                self._SYMBOLS)))
+        self._data_dir = os.path.join(self._temp_dir, 'universe_data')
+        self._config = {
+            'emailer_config': {},
+            'tor_scraper_config': {},
+            'logging_config': {'version': 1},
+            'historical_data_config': {
+                'symbols_file': self._symbols_file,
+                'output_dir': os.path.join(self._data_dir, '20160128') + (
+                    os.sep),
+                'start_date': '20150101',
+                'end_date': '20160128',
+                'trading_calendar': True,
+                'incremental': True,
+            },
+            'universe_report_config': {
+                'subject_format': 'Universe Report -- {}',
+                'body_returns': {
+                    1: {'bins_start': -.1, 'bins_stop': .11,
+                        'bins_step': .02},
+                },
+                'body_stats': {20: {'count': 3}},
+                'rolling_state_file': os.path.join(
+                    self._data_dir, 'rolling_state.pickle'),
+            },
+        }
+        self._config_file = os.path.join(self._temp_dir, 'config.yaml')
+        with open(self._config_file, 'wb') as output_file:
+            output_file.write(yaml.dump(self._config))
+
+    def tearDown(self):
+        sys.argv = self._argv
+        historical_data.HistoricalData.get_daily = self._get_daily
+        emailer.Emailer = self._emailer
+        shutil.rmtree(self._temp_dir)
+
+    def _run_main(self, args):
+        """Runs main() with command line args.
+        """
+        sys.argv = ['main.py', '--config_file', self._config_file] + args
+        main.main()
+
+    def test_sharded_report_from_empty_data_dir(self):
+        shard_dir = os.path.join(self._temp_dir, 'shards')
+        for i in range(3):
+            self._run_main(['--shard_index', str(i), '--shard_count', '3',
+                            '--shard_dir', shard_dir])
+            self.assertTrue(os.path.exists(main.get_partial_path(
+                shard_dir, i, 3)))
+        self._run_main(['--merge_shards', '--shard_count', '3',
+                        '--shard_dir', shard_dir])
+
+        expected = universe_report.UniverseReport(self._config[
+            'universe_report_config'], self._daily).get_report()
+        self.assertEqual(_FakeEmailer.sent, [(expected['subject'], expected[
+            'plain_body'])])
+
+    def test_multi_report_rejects_overrides_and_shards(self):
+        self._config['report_config_files'] = [self._config_file]
+        with open(self._config_file, 'wb') as output_file:
+            output_file.write(yaml.dump(self._config))
+        stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            for args in [['--symbols_file', self._symbols_file],
+                         ['--start_date', '20150101'],
+                         ['--shard_index', '0', '--shard_count', '2',
+                          '--shard_dir', self._temp_dir]]:
+                with self.assertRaises(SystemExit):
+                    self._run_main(args)
+        finally:
+            sys.stderr.close()
+            sys.stderr = stderr
+
+if __name__ == '__main__':
+    unittest.main()
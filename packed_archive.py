@@ -0,0 +1,130 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""PackedArchive is an append-only archive of compressed string payloads keyed
+by string. Payloads are appended to a single data file, and an index file holds
+one line per payload with its key, offset and length. Reading the whole archive
+is one read of the index and one scan of the data file through a memory map,
+and single payloads can also be read by their place in the index. If a key is
+appended more than once, the last payload wins.
+
+A payload is only indexed after it has been written, so an archive interrupted
+mid-append is still readable up to the last complete payload.
+
+Example:
+    import packed_archive
+    archive = packed_archive.PackedArchive('data/20160115/raw')
+    archive.append('SPY', 'Date,Open,High,Low,Close,Volume,Adj Close\\n')
+    payloads = archive.read_all()
+    offset, length = archive.read_index()['SPY']
+    payload = archive.read(offset, length)
+"""
+
+import mmap
+import os
+import threading
+import zlib
+
+class PackedArchive(object):
+    """Contains all functionality for the packed_archive module.
+    """
+    _DATA_SUFFIX = '.pack'
+    _INDEX_SUFFIX = '.index'
+
+    def __init__(self, path):
+        """PackedArchive must be initialized with args similar to those shown
+        in the example at the top of this file.
+
+        Args:
+            path: Path of the archive, without suffix. The data and index files
+                are created next to it if they do not exist.
+        """
+        self._data_path = path + self._DATA_SUFFIX
+        self._index_path = path + self._INDEX_SUFFIX
+        self._lock = threading.Lock()
+
+    @classmethod
+    def exists(cls, path):
+        """Returns whether an archive exists at the given path.
+
+        Args:
+            path: Path of the archive, without suffix.
+        """
+        return os.path.exists(path + cls._INDEX_SUFFIX)
+
+    def append(self, key, data):
+        """Compresses and appends a payload. Safe to call from multiple
+        threads.
+
+        Args:
+            key: String key, which must not contain tabs or newlines.
+            data: String payload.
+        """
+        compressed = zlib.compress(data)
+        with self._lock:
+            with open(self._data_path, 'ab') as data_file:
+                data_file.seek(0, os.SEEK_END)
+                offset = data_file.tell()
+                data_file.write(compressed)
+            with open(self._index_path, 'ab') as index_file:
+                index_file.write('{}\t{}\t{}\n'.format(key, offset, len(
+                    compressed)))
+
+    def read_index(self):
+        """Returns a dict of (offset, length) keyed by key for every complete
+        payload.
+        """
+        if not os.path.exists(self._index_path):
+            return {}
+        data_size = os.path.getsize(self._data_path)
+        index = {}
+        with open(self._index_path, 'rb') as index_file:
+            # The last line is either empty or an incomplete append.
+            for line in index_file.read().split('\n')[:-1]:
+                fields = line.split('\t')
+                offset = int(fields[1])
+                length = int(fields[2])
+                if offset + length <= data_size:
+                    index[fields[0]] = (offset, length)
+        return index
+
+    def read(self, offset, length):
+        """Returns a single payload.
+
+        Args:
+            offset: Offset of the payload, as returned by read_index().
+            length: Length of the payload, as returned by read_index().
+        """
+        with open(self._data_path, 'rb') as data_file:
+            data_file.seek(offset)
+            return zlib.decompress(data_file.read(length))
+
+    def read_all(self):
+        """Returns a dict of every payload keyed by key.
+        """
+        index = self.read_index()
+        if len(index) == 0:
+            return {}
+        payloads = {}
+        with open(self._data_path, 'rb') as data_file:
+            data_map = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for key, value in sorted(index.iteritems(),
+                                         key=lambda x: x[1][0]):
+                    payloads[key] = zlib.decompress(
+                        data_map[value[0]:value[0] + value[1]])
+            finally:
+                data_map.close()
+        return payloads
@@ -14,15 +14,26 @@
 # ==============================================================================
 
 """
-Contains utility functions for generating plots with matplotlib.
+Contains utility functions for generating plots with matplotlib. Plot images are
+rendered on figures with their own Agg canvas instead of through pyplot, so
+figures never enter its global registry, and are reused from a small pool.
 """
 
 import io
+import multiprocessing
+import threading
 
 import matplotlib as mpl
+import matplotlib.backends.backend_agg
+import matplotlib.figure
 import matplotlib.pyplot as plt
 import numpy as np
 
+_FIGURE_POOL_SIZE = 4
+_FIGURE_MAX_USES = 100
+_figure_pool = []
+_figure_pool_lock = threading.Lock()
+
 def format_x_ticks_as_dates(plot):
     """Formats x ticks YYYY-MM-DD and removes the default 'Date' label.
 
@@ -83,25 +94,130 @@ def add_bar_labels(plot, labels, text_color):
             label), ha='center', va=vert_align, color=text_color)
     return plot
 
+def _acquire_figure():
+    """Returns a tuple (figure, use_count) of a blank figure from the pool, or
+    a new one if the pool is empty, set up as a new pyplot figure would be from
+    the current rcParams.
+    """
+    with _figure_pool_lock:
+        pooled = _figure_pool.pop() if len(_figure_pool) > 0 else None
+    if pooled is None:
+        figure = mpl.figure.Figure()
+        mpl.backends.backend_agg.FigureCanvasAgg(figure)
+        return figure, 0
+    figure = pooled[0]
+    figure.set_size_inches(mpl.rcParams['figure.figsize'], forward=False)
+    figure.set_dpi(mpl.rcParams['figure.dpi'])
+    figure.set_facecolor(mpl.rcParams['figure.facecolor'])
+    figure.set_edgecolor(mpl.rcParams['figure.edgecolor'])
+    figure.subplotpars = mpl.figure.SubplotParams()
+    return pooled
+
+def _release_figure(figure, use_count):
+    """Clears a figure and returns it to the pool, unless the pool is full or
+    the figure has been used _FIGURE_MAX_USES times. Figure transforms keep a
+    reference to every axes ever drawn on them, so figures are retired to keep
+    memory bounded.
+    """
+    figure.clf()
+    with _figure_pool_lock:
+        if len(_figure_pool) < _FIGURE_POOL_SIZE and (
+                use_count + 1 < _FIGURE_MAX_USES):
+            _figure_pool.append((figure, use_count + 1))
+
 def get_plot_image(plot_func, **kwargs):
-    """Calls the provided function to draw an arbitrary plot on a new figure and
-    returns an image of the resulting figure.
+    """Calls the provided function to draw an arbitrary plot on a blank figure
+    and returns an image of the resulting figure. The figure is always released
+    afterwards, even if plotting fails.
 
     Args:
-        plot_func: Function which draws a plot on the matplotlib figure.
+        plot_func: Function which draws a plot on the matplotlib.Axes passed
+            to it as ax.
         **kwargs: Arguments passed through to plot_func.
     """
-    # Call plotting function to plot figure.
-    plt.figure()
-    plot_func(**kwargs)
-    plt.tight_layout()
-
-    # Return image as raw bytes in PNG format.
-    raw_bytes = io.BytesIO()
-    plt.savefig(raw_bytes, format='png')
+    figure, use_count = _acquire_figure()
+    try:
+        # Call plotting function to plot figure.
+        plot_func(ax=figure.add_subplot(111), **kwargs)
+        figure.tight_layout()
+
+        # Return image as raw bytes in PNG format.
+        raw_bytes = io.BytesIO()
+        figure.savefig(raw_bytes, format='png')
+    finally:
+        _release_figure(figure, use_count)
     raw_bytes.seek(0)
     return raw_bytes
 
+def get_plot_array(plot_func, **kwargs):
+    """Same as get_plot_image(), but returns the pixels of the image as a numpy
+    array of shape (height, width, 4) in RGBA order, read straight from the
+    canvas without encoding.
+
+    Args:
+        plot_func: Function which draws a plot on the matplotlib.Axes passed
+            to it as ax.
+        **kwargs: Arguments passed through to plot_func.
+    """
+    figure, use_count = _acquire_figure()
+    try:
+        plot_func(ax=figure.add_subplot(111), **kwargs)
+        figure.tight_layout()
+
+        # Draw as savefig() would, so pixels match get_plot_image().
+        if mpl.rcParams['savefig.dpi'] != 'figure':
+            figure.set_dpi(mpl.rcParams['savefig.dpi'])
+        figure.set_facecolor(mpl.rcParams['savefig.facecolor'])
+        figure.set_edgecolor(mpl.rcParams['savefig.edgecolor'])
+        figure.canvas.draw()
+        renderer = figure.canvas.get_renderer()
+        return np.frombuffer(figure.canvas.buffer_rgba(), np.uint8).reshape(
+            int(renderer.height), int(renderer.width), 4).copy()
+    finally:
+        _release_figure(figure, use_count)
+
+def _init_worker(style):
+    """Prepares a worker process for plotting with a non-interactive backend
+    and the given style sheet.
+    """
+    plt.switch_backend('Agg')
+    if style is not None:
+        plt.style.use(style)
+
+def _get_job_array(plot_job):
+    """Returns the result of get_plot_array() for a (plot_func, kwargs) job.
+    Defined at module level so that it can be sent to worker processes.
+    """
+    return get_plot_array(plot_job[0], **plot_job[1])
+
+def get_plot_arrays(plot_jobs, process_count=1, style=None):
+    """Yields an array as returned by get_plot_array() for each job, in the
+    same order, optionally rendering them across a pool of worker processes.
+    Arrays are yielded as soon as they are ready, so callers need not hold them
+    all at once. Output is the same either way.
+
+    Args:
+        plot_jobs: List of (plot_func, kwargs). plot_func must be defined at
+            module level and kwargs must be picklable if process_count > 1.
+        process_count: Number of worker processes. If 1, plot serially in
+            this process.
+        style: Style sheet used by worker processes. This process is assumed
+            to be using it already.
+    """
+    if process_count <= 1 or len(plot_jobs) <= 1:
+        for plot_job in plot_jobs:
+            yield _get_job_array(plot_job)
+        return
+
+    pool = multiprocessing.Pool(min(process_count, len(plot_jobs)),
+                                _init_worker, (style,))
+    try:
+        for plot_array in pool.imap(_get_job_array, plot_jobs):
+            yield plot_array
+    finally:
+        pool.close()
+        pool.join()
+
 def get_percent_strings(values):
     """Formats floating point values as percent strings with one decimal place
     e.g. '%99.9'.
@@ -26,7 +26,13 @@ Example:
         return
     print portfolio_report.PortfolioReport({
         'subject_format': 'Portfolio Report -- {}',
+        'render_process_count': 1,  # Optional, opt in to a process pool.
     }, daily).get_report()
+
+    # Many portfolios over the same data are evaluated together.
+    for report in portfolio_report.PortfolioReport.create_batch(
+            portfolio_report_configs, daily):
+        print report.get_report()
 """
 
 import io
@@ -38,14 +44,15 @@ import PIL
 
 import plot_utils
 
+_TEXT_COLOR = (.3, .3, .3, 1.0)
+_BAR_ALPHA = .67
+_TITLE_DOLLAR_FORMAT = '${:,.2f}'
+
 class PortfolioReport(object):
     """Contains all functionality for the portfolio_report module.
     """
     _FILENAME = 'report.png'
     _STYLE_SHEET = 'ggplot'
-    _TEXT_COLOR = (.3, .3, .3, 1.0)
-    _BAR_ALPHA = .67
-    _TITLE_DOLLAR_FORMAT = '${:,.2f}'
     _REPORT_COLS = 2
 
     def __init__(self, portfolio_report_config, daily):
@@ -60,75 +67,241 @@ class PortfolioReport(object):
         """
         self._config = portfolio_report_config
         self._daily = daily
+        self._cache = {}
+        self._cache_token = None
+
+    @classmethod
+    def create_batch(cls, portfolio_report_configs, daily):
+        """Returns a PortfolioReport for each config, with the derived frames of
+        all of them calculated together. Holdings of every portfolio are
+        stacked into arrays of shape (portfolios, dates, symbols), so values,
+        returns, group sums and P&L each take one vectorized operation however
+        many portfolios there are.
+
+        Args:
+            portfolio_report_configs: List of portfolio_report_config.
+            daily: Shared by all reports, see __init__().
+        """
+        reports = [cls(x, daily) for x in portfolio_report_configs]
+        if len(reports) == 0:
+            return reports
+        close = daily['close']
+        percent_returns = reports[0]._get_percent_returns()
+        cumulative_returns = reports[0]._get_percent_returns(True)
+
+        # Gather per-portfolio schedules, date ranges and symbol groups, with
+        # groups stored as membership matrices of shape (groups, symbols).
+        segments = []
+        position_schedules = []
+        capital_schedules = []
+        memberships = []
+        for report in reports:
+            dates, report_segments = report._get_date_segments()
+            segments.append(report_segments)
+            positions = np.full((len(dates) + 1, close.shape[1]), np.nan)
+            capital_changes = np.zeros(len(dates) + 1)
+            for i, item in enumerate(dates):
+                symbols = report._config['dates'][item]['symbols']
+                for j, key in enumerate(close.columns):
+                    value = symbols.get(key)
+                    if value is not None:
+                        positions[i + 1, j] = value * report._config[
+                            'value_ratio']
+                if i > 0:
+                    capital_changes[i + 1] = report._config['dates'][item][
+                        'capital_change'] * report._config['value_ratio']
+            position_schedules.append(positions)
+            capital_schedules.append(np.cumsum(capital_changes))
+            group_items = sorted(report._config['symbol_groups'].iteritems())
+            membership = np.zeros((len(group_items), close.shape[1]))
+            for i, (_, value) in enumerate(group_items):
+                np.add.at(membership[i], [close.columns.get_loc(x) for x in (
+                    value)], 1.0)
+            memberships.append(membership)
+
+        # Expand schedules to (portfolios, dates, symbols). Positions not held
+        # are NaN in the schedules and zero in dollar values.
+        segments = np.array(segments)
+        positions = np.array([x[y] for x, y in zip(
+            position_schedules, segments)])
+        dollar_values = np.where(np.isnan(positions), 0.0, (
+            close.values[np.newaxis] * positions))
+        dollar_returns = dollar_values * percent_returns.values[np.newaxis]
+
+        # Groups are padded to the most of any portfolio and summed with one
+        # batched matrix product, treating nulls as zero like DataFrame.sum().
+        group_count = max(len(x) for x in memberships)
+        group_memberships = np.zeros((len(reports), close.shape[1],
+                                      group_count))
+        for i, membership in enumerate(memberships):
+            group_memberships[i, :, :len(membership)] = membership.T
+        group_dollar_values = np.matmul(np.nan_to_num(dollar_values),
+                                        group_memberships)
+        group_dollar_returns = np.matmul(np.nan_to_num(dollar_returns),
+                                         group_memberships)
+
+        # P&L is zeroed on the first date of each portfolio, then adjusted by
+        # its cumulative capital changes.
+        profit_and_loss = np.nansum(dollar_values, axis=2)
+        first_dates = np.argmax(segments > 0, axis=1)
+        profit_and_loss -= np.where(
+            np.arange(close.shape[0])[np.newaxis] >= first_dates[:, np.newaxis],
+            profit_and_loss[np.arange(len(reports)), first_dates][
+                :, np.newaxis],
+            0.0)
+        profit_and_loss -= np.array([x[y] for x, y in zip(
+            capital_schedules, segments)])
+
+        for i, report in enumerate(reports):
+            group_names = sorted(report._config['symbol_groups'])
+            report._set_cached(('percent_returns', False, False),
+                               percent_returns)
+            report._set_cached(('percent_returns', False, True),
+                               cumulative_returns)
+            report._set_cached(('dollar_values', False, False), pd.DataFrame(
+                dollar_values[i], index=close.index, columns=close.columns))
+            report._set_cached(('dollar_returns', False, False), pd.DataFrame(
+                dollar_returns[i], index=close.index, columns=close.columns))
+            report._set_cached(('dollar_values', True, False), pd.DataFrame(
+                group_dollar_values[i, :, :len(group_names)],
+                index=close.index, columns=group_names))
+            report._set_cached(('dollar_returns', True, False), pd.DataFrame(
+                group_dollar_returns[i, :, :len(group_names)],
+                index=close.index, columns=group_names))
+            report._set_cached(('profit_and_loss', False, False), pd.Series(
+                profit_and_loss[i], index=close.index))
+        return reports
+
+    def _check_cache(self):
+        """Clears the cache if daily or config has changed since it was
+        filled.
+        """
+        token = (repr(self._config), sorted(
+            (x, id(y), y.shape) for x, y in self._daily.iteritems()))
+        if token != self._cache_token:
+            self._cache.clear()
+            self._cache_token = token
+
+    def _set_cached(self, key, data):
+        """Stores a read-only copy of the derived frame for key, a tuple (kind,
+        group, cumulative).
+        """
+        self._check_cache()
+        values = np.array(data.values)
+        values.flags.writeable = False
+        if isinstance(data, pd.Series):
+            data = pd.Series(values, index=data.index, name=data.name)
+        else:
+            data = pd.DataFrame(values, index=data.index,
+                                columns=data.columns, copy=False)
+        self._cache[key] = data
+
+    def _get_cached(self, key, calculate, *args):
+        """Returns the derived frame for key, a tuple (kind, group,
+        cumulative), calling calculate(*args) only if it is not cached.
+        Frames are handed out as shallow copies of read-only data, so callers
+        may add columns but cannot modify cached values.
+        """
+        self._check_cache()
+        if key not in self._cache:
+            self._set_cached(key, calculate(*args))
+        return self._cache[key].copy(deep=False)
 
     def _get_percent_returns(self, cumulative=False):
         """Calculate percent returns for the entire time period, either
         cumulative from the beginning or separately for each day.
         """
+        return self._get_cached(('percent_returns', False, cumulative),
+                                self._calculate_percent_returns, cumulative)
+
+    def _calculate_percent_returns(self, cumulative):
+        """Uncached implementation of _get_percent_returns().
+        """
         if cumulative is True:
             return self._daily['adj_close'] / (
                 self._daily['adj_close'].ix[0, :]) - 1.0
         else:
             return self._daily['adj_close'].pct_change()
 
+    def _get_date_segments(self):
+        """Returns the sorted dates in config, and for each row of daily the
+        index of the date range it falls in. Rows before the earliest date are
+        in range 0, and rows from dates[i] until the next date in range i + 1.
+        """
+        dates = sorted(self._config['dates'])
+        segments = np.searchsorted(
+            pd.to_datetime([str(x) for x in dates]).values,
+            self._daily['close'].index.values, side='right')
+        return dates, segments
+
     def _get_dollar_values(self, group=False):
         """Calculate the value of portfolio holdings using closing prices.
         Optionally aggregate the values into groups provided in config.
         """
-        dates = sorted(self._config['dates'])
-
-        # Copy dataframe and zero data before earliest portfolio date.
-        dollar_values = self._daily['close'].copy()
-        dollar_values.ix[
-            dollar_values.index < pd.to_datetime(str(dates[0])), :] = 0.0
-
-        # Loop thru dates and calculate each date range using bitmask index.
-        for i, item in enumerate(dates):
-            index = dollar_values.index >= pd.to_datetime(str(item))
-            if i < (len(dates) - 1):
-                index = index & (
-                    dollar_values.index < pd.to_datetime(str(dates[i + 1])))
-            for key in list(dollar_values.columns.values):
-                value = self._config['dates'][item]['symbols'].get(key)
-                if value is None:
-                    dollar_values.ix[index, key] = 0.0
-                else:
-                    dollar_values.ix[index, key] *= value * self._config[
-                        'value_ratio']
+        return self._get_cached(('dollar_values', group, False),
+                                self._calculate_dollar_values, group)
 
+    def _calculate_dollar_values(self, group):
+        """Uncached implementation of _get_dollar_values().
+        """
         if group is True:
-            dollar_values = self._sum_symbol_groups(dollar_values)
-        return dollar_values
+            return self._sum_symbol_groups(self._get_dollar_values())
+        dates, segments = self._get_date_segments()
+        close = self._daily['close']
+
+        # Scaled positions of each date range, where range 0 holds nothing,
+        # expanded to a dense matrix with one row per row of daily.
+        positions = np.zeros((len(dates) + 1, close.shape[1]))
+        is_held = np.zeros(positions.shape, dtype=bool)
+        for i, item in enumerate(dates):
+            symbols = self._config['dates'][item]['symbols']
+            for j, key in enumerate(close.columns):
+                value = symbols.get(key)
+                if value is not None:
+                    positions[i + 1, j] = value * self._config['value_ratio']
+                    is_held[i + 1, j] = True
+        dollar_values = np.where(
+            is_held[segments], close.values * positions[segments], 0.0)
+        return pd.DataFrame(dollar_values, index=close.index,
+                            columns=close.columns)
 
     def _get_dollar_returns(self, group=False):
         """Calculate the dollar returns for portfolio holdings. Optionally
         aggregate the returns into groups provided in config.
         """
-        dollar_values = self._get_dollar_values()
-        percent_returns = self._get_percent_returns()
-        dollar_returns = dollar_values * percent_returns
+        return self._get_cached(('dollar_returns', group, False),
+                                self._calculate_dollar_returns, group)
+
+    def _calculate_dollar_returns(self, group):
+        """Uncached implementation of _get_dollar_returns().
+        """
         if group is True:
-            dollar_returns = self._sum_symbol_groups(dollar_returns)
-        return dollar_returns
+            return self._sum_symbol_groups(self._get_dollar_returns())
+        return self._get_dollar_values() * self._get_percent_returns()
 
     def _get_profit_and_loss(self):
         """Calculate the profit and loss of the portfolio over time.
         """
+        return self._get_cached(('profit_and_loss', False, False),
+                                self._calculate_profit_and_loss)
+
+    def _calculate_profit_and_loss(self):
+        """Uncached implementation of _get_profit_and_loss().
+        """
         profit_and_loss = self._get_dollar_values().sum(1)
-        dates = sorted(self._config['dates'])
+        dates, segments = self._get_date_segments()
 
         # Correct spike on first portfolio date.
-        first_date = np.argmax(
-            profit_and_loss.index >= pd.to_datetime(str(dates[0])))
+        first_date = np.argmax(segments > 0)
         profit_and_loss.ix[first_date:] -= profit_and_loss.ix[first_date]
 
-        # Adjust for capital changes.
+        # Adjust for capital changes, which accumulate from the second date.
+        capital_changes = np.zeros(len(dates) + 1)
         for i, item in enumerate(dates):
             if i > 0:
-                index = profit_and_loss.index >= pd.to_datetime(str(item))
-                profit_and_loss.ix[index] -= self._config[
-                    'dates'][item]['capital_change'] * self._config[
-                        'value_ratio']
+                capital_changes[i + 1] = self._config['dates'][item][
+                    'capital_change'] * self._config['value_ratio']
+        profit_and_loss -= np.cumsum(capital_changes)[segments]
 
         return profit_and_loss
 
@@ -140,41 +313,44 @@ class PortfolioReport(object):
             sum_data_frame[key] = data_frame[value].sum(1)
         return sum_data_frame
 
+    def _get_plot_jobs(self):
+        """Returns a list of (plot_func, kwargs) for each plot of the report
+        in grid order, where plot_func is one of the plot functions of this
+        module and kwargs are the small precomputed series it draws.
+        """
+        plot_jobs = []
+        for group in (True, False):
+            plot_jobs.append((plot_dollar_change_bars, {
+                'dollar_values': self._get_dollar_values(group).ix[-1, :],
+                'dollar_returns': self._get_dollar_returns(group).ix[-1, :]}))
+        for group in (True, False):
+            plot_jobs.append((plot_dollar_value_bars, {
+                'dollar_values': self._get_dollar_values(group).ix[-1, :]}))
+        for group in (True, False):
+            plot_jobs.append((plot_dollar_value_lines, {
+                'dollar_values': self._get_dollar_values(group)}))
+        plot_jobs.append((plot_profit_and_loss_lines, {
+            'profit_and_loss': self._get_profit_and_loss()}))
+        plot_jobs.append((plot_percent_return_lines, {
+            'percent_returns': self._get_percent_returns(True)}))
+        return plot_jobs
+
     def plot_dollar_change_bars(self, group=False):
         """Plot the change in dollars for the most recent day as a bar plot.
 
         Args:
             group: Whether to aggregate based on symbol_groups in config.
         """
-        dollar_values = self._get_dollar_values(group).ix[-1, :]
-        dollar_returns = self._get_dollar_returns(group).ix[-1, :]
-        percent_returns = dollar_returns / dollar_values
-        labels = plot_utils.get_percent_strings(percent_returns)
-        bar_colors = plot_utils.get_conditional_colors(
-            percent_returns, self._BAR_ALPHA)
-        title = ('1-Day Change | ' + self._TITLE_DOLLAR_FORMAT + (
-            '\n')).format(np.sum(dollar_returns))
-
-        plot = dollar_returns.plot(kind='bar', color=bar_colors)
-        plot.set_title(title, color=self._TEXT_COLOR)
-        plot.set_xticklabels(dollar_returns.index, rotation=0)
-        plot_utils.format_y_ticks_as_dollars(plot)
-        plot_utils.add_bar_labels(plot, labels, self._TEXT_COLOR)
-        return plot
+        return plot_dollar_change_bars(
+            plt.gca(), self._get_dollar_values(group).ix[-1, :],
+            self._get_dollar_returns(group).ix[-1, :])
 
     def plot_percent_return_lines(self):
         """Plot percent returns for each symbol for the entire time period as a
         line plot.
         """
-        percent_returns = self._get_percent_returns(True)
-        title = 'Symbol Returns\n'
-
-        plot = percent_returns.plot(kind='line', ax=plt.gca())
-        plot.set_title(title, color=self._TEXT_COLOR)
-        plot_utils.format_x_ticks_as_dates(plot)
-        plot_utils.format_y_ticks_as_percents(plot)
-        plot_utils.format_legend(plot, self._TEXT_COLOR)
-        return plot
+        return plot_percent_return_lines(plt.gca(),
+                                         self._get_percent_returns(True))
 
     def plot_dollar_value_bars(self, group=False):
         """Plot the dollar value of portfolio holdings for the most recent day
@@ -183,17 +359,8 @@ class PortfolioReport(object):
         Args:
             group: Whether to aggregate based on symbol_groups in config.
         """
-        dollar_values = self._get_dollar_values(group).ix[-1, :]
-        percents = dollar_values / np.sum(dollar_values)
-        labels = plot_utils.get_percent_strings(percents)
-        title = 'Portfolio Weights\n'
-
-        plot = dollar_values.plot(kind='bar', alpha=self._BAR_ALPHA)
-        plot.set_title(title, color=self._TEXT_COLOR)
-        plot.set_xticklabels(dollar_values.index, rotation=0)
-        plot_utils.format_y_ticks_as_dollars(plot)
-        plot_utils.add_bar_labels(plot, labels, self._TEXT_COLOR)
-        return plot
+        return plot_dollar_value_bars(plt.gca(), self._get_dollar_values(
+            group).ix[-1, :])
 
     def plot_dollar_value_lines(self, group=False):
         """Plot the dollar value of portfolio holdings for the entire time
@@ -202,38 +369,20 @@ class PortfolioReport(object):
         Args:
             group: Whether to aggregate based on symbol_groups in config.
         """
-        dollar_values = self._get_dollar_values(group)
-        dollar_values['TOTAL'] = dollar_values.sum(1)
-        title = ('Portfolio Value | ' + self._TITLE_DOLLAR_FORMAT + (
-            '\n')).format(dollar_values['TOTAL'].ix[-1])
-
-        plot = dollar_values.plot(kind='line', ax=plt.gca())
-        plot.set_title(title, color=self._TEXT_COLOR)
-        plot_utils.format_x_ticks_as_dates(plot)
-        plot_utils.format_y_ticks_as_dollars(plot)
-        plot_utils.format_legend(plot, self._TEXT_COLOR)
-        return plot
+        return plot_dollar_value_lines(plt.gca(), self._get_dollar_values(
+            group))
 
     def plot_profit_and_loss_lines(self):
         """Plot the profit and loss of the portfolio for the entire time period
         as a line plot.
-
-        Args:
-            group: Whether to aggregate based on symbol_groups in config.
         """
-        profit_and_loss = self._get_profit_and_loss()
-        title = ('Cumulative P&L | ' + self._TITLE_DOLLAR_FORMAT + (
-            '\n')).format(profit_and_loss[-1])
-
-        plot = profit_and_loss.plot(kind='line', ax=plt.gca())
-        plot.set_title(title, color=self._TEXT_COLOR)
-        plot_utils.format_x_ticks_as_dates(plot)
-        plot_utils.format_y_ticks_as_dollars(plot)
-        return plot
-
+        return plot_profit_and_loss_lines(plt.gca(),
+                                          self._get_profit_and_loss())
 
     def get_report(self):
-        """Creates the entire report composed of individual plots.
+        """Creates the entire report composed of individual plots. Plots are
+        rendered in this process unless render_process_count in config opts in
+        to a pool of that many worker processes.
         """
         subject = self._config['subject_format'].format(str(
             self._daily['adj_close'].index[-1].date()))
@@ -241,41 +390,125 @@ class PortfolioReport(object):
 
         plt.style.use(self._STYLE_SHEET)
 
-        # Create list of plot images to include in the report image.
-        plot_images = []
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_change_bars, group=True))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_change_bars))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_value_bars, group=True))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_value_bars))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_value_lines, group=True))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_dollar_value_lines))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_profit_and_loss_lines))
-        plot_images.append(plot_utils.get_plot_image(
-            self.plot_percent_return_lines))
-        plot_images = [PIL.Image.open(x) for x in plot_images]
-
-        # Arrange plot images in a grid in the report image.
-        plot_width = plot_images[0].size[0]
-        plot_height = plot_images[0].size[1]
-        report_image = PIL.Image.new('RGB', (
-            plot_width * self._REPORT_COLS, plot_height * int(
-                np.ceil(len(plot_images) / self._REPORT_COLS))), 'white')
-        for i, item in enumerate(plot_images):
-            report_image.paste(item, ((i % self._REPORT_COLS) * plot_width, int(
-                np.floor(i / self._REPORT_COLS)) * plot_height))
-
-        # Convert report image to bytes in PNG format.
+        # Arrange plot pixels in a grid in the report pixels as each plot is
+        # rendered, dropping alpha since plots are opaque.
+        plot_jobs = self._get_plot_jobs()
+        for i, item in enumerate(plot_utils.get_plot_arrays(
+                plot_jobs, self._config.get('render_process_count', 1),
+                self._STYLE_SHEET)):
+            if i == 0:
+                plot_height, plot_width = item.shape[:2]
+                row_count = int(np.ceil(len(plot_jobs) / self._REPORT_COLS))
+                report_array = np.full((
+                    plot_height * row_count, plot_width * self._REPORT_COLS,
+                    3), 255, dtype=np.uint8)
+            row = int(np.floor(i / self._REPORT_COLS)) * plot_height
+            col = (i % self._REPORT_COLS) * plot_width
+            report_array[row:row + plot_height, col:col + plot_width] = (
+                item[:, :, :3])
+
+        # Convert report pixels to bytes in PNG format.
         report_image_bytes = io.BytesIO()
-        report_image.save(report_image_bytes, format='png')
+        PIL.Image.fromarray(report_array, 'RGB').save(report_image_bytes,
+                                                     format='png')
         report_image_bytes.seek(0)
 
         return {'subject': subject,
                 'plain_body': plain_body,
                 'files': {self._FILENAME: report_image_bytes}}
+
+def plot_dollar_change_bars(ax, dollar_values, dollar_returns):
+    """Plot the change in dollars for the most recent day as a bar plot.
+
+    Args:
+        ax: matplotlib.Axes to plot on.
+        dollar_values: pandas.Series of dollar values for the most recent day.
+        dollar_returns: pandas.Series of dollar returns for the most recent
+            day.
+    """
+    percent_returns = dollar_returns / dollar_values
+    labels = plot_utils.get_percent_strings(percent_returns)
+    bar_colors = plot_utils.get_conditional_colors(
+        percent_returns, _BAR_ALPHA)
+    title = ('1-Day Change | ' + _TITLE_DOLLAR_FORMAT + (
+        '\n')).format(np.sum(dollar_returns))
+
+    plot = dollar_returns.plot(kind='bar', color=bar_colors, ax=ax)
+    plot.set_title(title, color=_TEXT_COLOR)
+    plot.set_xticklabels(dollar_returns.index, rotation=0)
+    plot_utils.format_y_ticks_as_dollars(plot)
+    plot_utils.add_bar_labels(plot, labels, _TEXT_COLOR)
+    return plot
+
+def plot_percent_return_lines(ax, percent_returns):
+    """Plot percent returns for each symbol for the entire time period as a
+    line plot.
+
+    Args:
+        ax: matplotlib.Axes to plot on.
+        percent_returns: pandas.DataFrame of cumulative percent returns.
+    """
+    title = 'Symbol Returns\n'
+
+    plot = percent_returns.plot(kind='line', ax=ax)
+    plot.set_title(title, color=_TEXT_COLOR)
+    plot_utils.format_x_ticks_as_dates(plot)
+    plot_utils.format_y_ticks_as_percents(plot)
+    plot_utils.format_legend(plot, _TEXT_COLOR)
+    return plot
+
+def plot_dollar_value_bars(ax, dollar_values):
+    """Plot the dollar value of portfolio holdings for the most recent day as a
+    bar plot.
+
+    Args:
+        ax: matplotlib.Axes to plot on.
+        dollar_values: pandas.Series of dollar values for the most recent day.
+    """
+    percents = dollar_values / np.sum(dollar_values)
+    labels = plot_utils.get_percent_strings(percents)
+    title = 'Portfolio Weights\n'
+
+    plot = dollar_values.plot(kind='bar', alpha=_BAR_ALPHA, ax=ax)
+    plot.set_title(title, color=_TEXT_COLOR)
+    plot.set_xticklabels(dollar_values.index, rotation=0)
+    plot_utils.format_y_ticks_as_dollars(plot)
+    plot_utils.add_bar_labels(plot, labels, _TEXT_COLOR)
+    return plot
+
+def plot_dollar_value_lines(ax, dollar_values):
+    """Plot the dollar value of portfolio holdings for the entire time period
+    as a line plot.
+
+    Args:
+        ax: matplotlib.Axes to plot on.
+        dollar_values: pandas.DataFrame of dollar values. A TOTAL column is
+            added to it.
+    """
+    dollar_values['TOTAL'] = dollar_values.sum(1)
+    title = ('Portfolio Value | ' + _TITLE_DOLLAR_FORMAT + (
+        '\n')).format(dollar_values['TOTAL'].ix[-1])
+
+    plot = dollar_values.plot(kind='line', ax=ax)
+    plot.set_title(title, color=_TEXT_COLOR)
+    plot_utils.format_x_ticks_as_dates(plot)
+    plot_utils.format_y_ticks_as_dollars(plot)
+    plot_utils.format_legend(plot, _TEXT_COLOR)
+    return plot
+
+def plot_profit_and_loss_lines(ax, profit_and_loss):
+    """Plot the profit and loss of the portfolio for the entire time period as
+    a line plot.
+
+    Args:
+        ax: matplotlib.Axes to plot on.
+        profit_and_loss: pandas.Series of cumulative profit and loss.
+    """
+    title = ('Cumulative P&L | ' + _TITLE_DOLLAR_FORMAT + (
+        '\n')).format(profit_and_loss[-1])
+
+    plot = profit_and_loss.plot(kind='line', ax=ax)
+    plot.set_title(title, color=_TEXT_COLOR)
+    plot_utils.format_x_ticks_as_dates(plot)
+    plot_utils.format_y_ticks_as_dollars(plot)
+    return plot
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Contains a local HTTP server which replays responses recorded by
+HistoricalData with record_path set, so scraping and ingestion can be
+benchmarked offline and repeatably. Latency, jitter and errors can be injected.
+
+Requests are matched on the path and query of the recorded url, falling back to
+a response recorded for the same symbol. A symbol with a suffix of the
+form _N, such as SPY_7, is served the response for SPY, so a symbols file
+written with --scale N exercises N times as many symbols from one recording.
+
+To scrape from the server, set fetcher to 'http_fetcher' and base_url to
+'http://localhost:<port>/table.csv' in historical_data_config.
+
+Example:
+    ./replay_server.py --record_path recordings/universe --port 8000 \\
+        --latency .05 --jitter .02 --error_rate .01
+    ./replay_server.py --record_path recordings/universe \\
+        --symbols_file universe_symbols.csv --scale 10 \\
+        --scaled_symbols_file universe_symbols_10x.csv
+"""
+
+import argparse
+import BaseHTTPServer
+import csv
+import logging
+import random
+import re
+import SocketServer
+import time
+import urlparse
+
+import packed_archive
+
+_SCALED_SYMBOL_PATTERN = re.compile(r'^(.+)_\d+$')
+
+class ReplayServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Serves recorded responses, each request on its own thread.
+    """
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, server_address, responses, config):
+        """ReplayServer must be initialized with recorded responses and a
+        config of latency, jitter and error_rate, all in seconds or fractions.
+
+        Args:
+            server_address: (host, port) tuple to listen on.
+            responses: dict of response bodies keyed by recorded url.
+            config: Determines the behavior of this instance.
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, server_address,
+                                           ReplayRequestHandler)
+        self.config = config
+        self.responses = {}
+        self.symbol_responses = {}
+        for key, value in sorted(responses.iteritems()):
+            parts = urlparse.urlsplit(key)
+            self.responses[parts.path + '?' + parts.query] = value
+            symbol = urlparse.parse_qs(parts.query).get('s')
+            if symbol is not None:
+                self.symbol_responses[symbol[0]] = value
+
+    def get_response(self, path):
+        """Returns the recorded response for a request path, or None.
+        """
+        if path in self.responses:
+            return self.responses[path]
+        symbol = urlparse.parse_qs(urlparse.urlsplit(path).query).get('s')
+        if symbol is None:
+            return None
+        match = _SCALED_SYMBOL_PATTERN.match(symbol[0])
+        return self.symbol_responses.get(symbol[0], self.symbol_responses.get(
+            match.group(1) if match is not None else None))
+
+class ReplayRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles a single request to ReplayServer.
+    """
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_GET(self):
+        """Serves a recorded response after injected latency, or an error.
+        """
+        config = self.server.config
+        time.sleep(max(0.0, config['latency'] + random.uniform(
+            -config['jitter'], config['jitter'])))
+
+        body = self.server.get_response(self.path)
+        status = 200
+        if random.random() < config['error_rate']:
+            body = 'Service Unavailable'
+            status = 503
+        elif body is None:
+            body = 'Not Found'
+            status = 404
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Logs requests at debug level instead of to stderr.
+        """
+        logging.getLogger(__name__).debug(format % args)
+
+def write_scaled_symbols(symbols_file, scale, scaled_symbols_file):
+    """Writes a symbols file with scale copies of every symbol, copies after
+    the first having a suffix of the form _N.
+
+    Args:
+        symbols_file: Path of the symbols file to scale.
+        scale: Number of copies of each symbol.
+        scaled_symbols_file: Path of the symbols file to write.
+    """
+    with open(symbols_file, 'rb') as input_file:
+        rows = list(csv.reader(input_file, delimiter=','))
+    with open(scaled_symbols_file, 'wb') as output_file:
+        csv_writer = csv.writer(output_file, delimiter=',')
+        for i in range(scale):
+            for row in rows:
+                row = list(row)
+                if i > 0:
+                    row[1] = '{}_{}'.format(row[1], i)
+                csv_writer.writerow(row)
+
+def main():
+    """Begin executing main logic of the script.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record_path', metavar='PATH', help=(
+        'historical_data_config record_path'))
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help=(
+        'seconds added to every response'))
+    parser.add_argument('--jitter', type=float, default=0.0, help=(
+        'max seconds randomly added to or removed from latency'))
+    parser.add_argument('--error_rate', type=float, default=0.0, help=(
+        'fraction of responses which are 503 errors'))
+    parser.add_argument('--symbols_file', metavar='FILE', help=(
+        'symbols file to scale instead of serving'))
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--scaled_symbols_file', metavar='FILE')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.symbols_file is not None:
+        write_scaled_symbols(args.symbols_file, args.scale,
+                             args.scaled_symbols_file)
+        return
+
+    responses = packed_archive.PackedArchive(args.record_path).read_all()
+    server = ReplayServer(('', args.port), responses, {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+    })
+    logging.getLogger(__name__).info('Replaying {} responses on port {}'.format(
+        len(responses), args.port))
+    server.serve_forever()
+
+# If in top-level script environment, run main().
+if __name__ == '__main__':
+    main()
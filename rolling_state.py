@@ -0,0 +1,375 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""RollingState keeps per-symbol rolling window statistics for UniverseReport in
+a file, so each new trading day updates them in O(symbols) instead of
+recomputing them over the whole lookback.
+
+For each offset, the windows of UniverseReport._calculate_stats() are tracked:
+running price count, sum and sum of squares for the two halves used by
+volatility change, running volume sums for the two halves used by volume
+change, and monotonic deques of rows for the rolling max and min used by at
+high and at low. Each deque is a ring buffer with one column per symbol, so
+every symbol is pushed at once, and is stored in the file with only as many
+slots as its longest column.
+
+Prices are offset by a per-symbol shift before summing to limit rounding error.
+Running sums still drift as rows are added and removed, so the sums of a window
+are recomputed from daily, with the shift reset to the last price, for symbols
+where a null enters or leaves the window, and for every symbol once as many rows
+as the window holds have been added since. This keeps the update O(symbols) per
+row on average.
+
+When adj_close of a symbol has been adjusted since the last update, e.g. for a
+dividend or split, its price sums are recomputed. Deques hold rows rather than
+prices, and adjusting all past prices by the same ratio does not change their
+order. The state is rebuilt from daily if it is missing, was built for other
+offsets or symbols, or cannot be advanced to the last row of daily.
+
+Example:
+    import rolling_state
+    state = rolling_state.RollingState('universe_data/rolling_state.pickle')
+    stats = state.get_stats(daily, [20, 250])
+    stats[20]['at_high']  # numpy array of bool, one per symbol.
+"""
+
+import logging
+import os
+import cPickle as pickle
+
+import numpy as np
+
+_VARIANCE_TOLERANCE = 1e-12
+
+def get_std(sums):
+    """Returns the sample stdev of each column from rows of count, sum and sum
+    of squares of values, or NaN for fewer than two values. Sums carry rounding
+    error, so a variance this small relative to the mean square is that of a
+    constant value, and is zero.
+
+    Args:
+        sums: numpy array with rows of count, sum and sum of squares.
+    """
+    variance = (sums[2] - sums[1] * sums[1] / sums[0]) / (sums[0] - 1.0)
+    variance[variance <= sums[2] / sums[0] * _VARIANCE_TOLERANCE] = 0.0
+    return np.where(sums[0] > 1.0, np.sqrt(variance), np.nan)
+
+class RollingState(object):
+    """Contains all functionality for the rolling_state module.
+    """
+    _VERSION = 2
+
+    def __init__(self, path):
+        """RollingState must be initialized with args similar to those shown
+        in the example at the top of this file.
+
+        Args:
+            path: Path of the state file, created if it does not exist.
+        """
+        self._path = path
+        self._logger = logging.getLogger(__name__)
+
+    def get_stats(self, daily, offsets):
+        """Returns a dict keyed by offset of dicts of numpy arrays of the type
+        returned by UniverseReport._calculate_stats(), for the last row of
+        daily. The state file is advanced to that row, or rebuilt.
+
+        Args:
+            daily: dict of pandas.DataFrame of the type returned by
+                historical_data.get_daily().
+            offsets: List of numbers of rows (days) back to go.
+        """
+        offsets = sorted(offsets)
+        prices = daily['adj_close'].values
+        volumes = daily['volume'].values
+        dates = daily['adj_close'].index.values.astype(
+            'datetime64[ns]').view(np.int64)
+        symbols = [str(x) for x in daily['adj_close'].columns]
+
+        state = self._load()
+        if state is None or not self._advance(state, offsets, symbols, dates,
+                                              prices, volumes):
+            self._logger.info('Rebuilding rolling state: ' + self._path)
+            state = self._build(offsets, symbols, prices, volumes)
+        self._save(state, dates, prices, volumes)
+
+        last_prices = prices[-1, :]
+        stats = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for offset in offsets:
+                price_windows, volume_windows = self._get_windows(offset)
+                first, second = [state['sums'][x] for x in price_windows]
+                first_volume, second_volume = [
+                    state['sums'][x][1] for x in volume_windows]
+                stats[offset] = {
+                    'at_high': self._get_front_values(
+                        state['highs'][offset], prices) == last_prices,
+                    'at_low': self._get_front_values(
+                        state['lows'][offset], prices) == last_prices,
+                    'volatility_change': get_std(first) / get_std(second),
+                    'volume_change': first_volume / second_volume,
+                }
+        return stats
+
+    @staticmethod
+    def _get_windows(offset):
+        """Returns the (field, length, lag) windows used for an offset, as
+        ((price first half, price second half), (volume first half, volume
+        second half)). A window covers rows [end - lag - length, end - lag),
+        where end is the number of rows.
+        """
+        half = int(np.around(offset * .5))
+        return ((('adj_close', offset - half, half), (
+            'adj_close', half + 1, 0)), (('volume', offset - half, half), (
+                'volume', half, 0)))
+
+    @staticmethod
+    def _get_front_values(deque, prices):
+        """Returns the price at the front row of each symbol's deque, or NaN
+        for an empty deque.
+        """
+        columns = np.arange(prices.shape[1])
+        return np.where(deque['length'] > 0, prices[deque['rows'][
+            deque['start'], columns], columns], np.nan)
+
+    @staticmethod
+    def _is_occupied(deque):
+        """Returns a bool array of the shape of the ring buffer of a deque,
+        which is True for slots holding rows.
+        """
+        slots = np.arange(deque['rows'].shape[0])[:, np.newaxis]
+        return (slots - deque['start']) % deque['rows'].shape[0] < (
+            deque['length'])
+
+    @staticmethod
+    def _get_deviations(values, shift):
+        """Returns valid flags and values minus shift with nulls as zero.
+        """
+        is_valid = ~np.isnan(values)
+        deviations = values - shift
+        deviations[~is_valid] = 0.0
+        return is_valid, deviations
+
+    def _set_sums(self, state, window, values, columns):
+        """Recomputes the sums of a window from the values of its field for
+        the given columns, shifting prices by their last value.
+        """
+        field, length, lag = window
+        row_count = values.shape[0]
+        window_values = values[row_count - lag - length:row_count - lag,
+                               columns]
+        shift = np.zeros(window_values.shape[1])
+        if field == 'adj_close':
+            shift = np.nan_to_num(values[-1, columns])
+        is_valid, deviations = self._get_deviations(window_values, shift)
+        state['shifts'][window][columns] = shift
+        state['sums'][window][:, columns] = [
+            is_valid.sum(axis=0), deviations.sum(axis=0), (
+                deviations * deviations).sum(axis=0)]
+
+    def _build(self, offsets, symbols, prices, volumes):
+        """Returns a new state for the last row of daily.
+        """
+        row_count = prices.shape[0]
+        fields = {'adj_close': prices, 'volume': volumes}
+        state = {
+            'version': self._VERSION,
+            'offsets': offsets,
+            'symbols': symbols,
+            'shifts': {},
+            'sums': {},
+            'ages': {},
+            'highs': {},
+            'lows': {},
+        }
+        columns = np.ones(prices.shape[1], dtype=bool)
+        for offset in offsets:
+            for window in sum(self._get_windows(offset), ()):
+                state['shifts'][window] = np.zeros(prices.shape[1])
+                state['sums'][window] = np.zeros((3, prices.shape[1]))
+                state['ages'][window] = 0
+                self._set_sums(state, window, fields[window[0]], columns)
+
+            # A row is in the max (min) deque if its price is above (below)
+            # every later price in the window, since later rows pop it.
+            window_prices = prices[row_count - offset:]
+            with np.errstate(invalid='ignore'):
+                later_highs = np.fmax.accumulate(window_prices[::-1], axis=0)[
+                    ::-1]
+                later_lows = np.fmin.accumulate(window_prices[::-1], axis=0)[
+                    ::-1]
+                later_highs = np.vstack((later_highs[1:], np.full(
+                    (1, prices.shape[1]), np.nan)))
+                later_lows = np.vstack((later_lows[1:], np.full(
+                    (1, prices.shape[1]), np.nan)))
+                is_high = (window_prices > later_highs) | (
+                    np.isnan(later_highs) & ~np.isnan(window_prices))
+                is_low = (window_prices < later_lows) | (
+                    np.isnan(later_lows) & ~np.isnan(window_prices))
+            state['highs'][offset] = self._get_deque(is_high, row_count)
+            state['lows'][offset] = self._get_deque(is_low, row_count)
+        return state
+
+    @staticmethod
+    def _get_deque(is_member, row_count):
+        """Returns a deque holding the rows flagged in is_member, which has
+        one row per row of the window ending at row_count.
+        """
+        rows = np.zeros(is_member.shape, dtype=np.int64)
+        slots = np.cumsum(is_member, axis=0) - 1
+        window_rows, columns = np.nonzero(is_member)
+        rows[slots[window_rows, columns], columns] = window_rows + (
+            row_count - is_member.shape[0])
+        return {
+            'rows': rows,
+            'start': np.zeros(is_member.shape[1], dtype=np.int64),
+            'length': is_member.sum(axis=0),
+        }
+
+    def _advance(self, state, offsets, symbols, dates, prices, volumes):
+        """Advances a loaded state to the last row of daily in place. Returns
+        False if it cannot be, in which case it must be rebuilt.
+        """
+        if state.get('version') != self._VERSION or state['offsets'] != (
+                offsets) or state['symbols'] != symbols:
+            return False
+        last_row = np.searchsorted(dates, state['last_date'])
+        if last_row >= dates.size or dates[last_row] != state['last_date'] or (
+                last_row + 1 < max(offsets)):
+            return False
+
+        # Find symbols whose past prices have been adjusted. Volume is not
+        # expected to change, so if it has, rebuild.
+        is_null = np.isnan(prices[last_row, :])
+        if np.any(is_null != np.isnan(state['last_prices'])) or not (
+                np.array_equal(np.nan_to_num(volumes[last_row, :]),
+                               np.nan_to_num(state['last_volumes']))):
+            return False
+        is_adjusted = ~is_null & (prices[last_row, :] != state['last_prices'])
+        if np.any(is_adjusted):
+            self._logger.info('Recomputing rolling state for adjusted '
+                              'symbols: ' + ', '.join(np.array(symbols)[
+                                  is_adjusted]))
+
+        # Convert deques from dates to rows of daily, with a slot per row of
+        # their windows.
+        for key in ('highs', 'lows'):
+            for offset, deque in state[key].iteritems():
+                is_occupied = self._is_occupied(deque)
+                rows = np.minimum(np.searchsorted(dates, deque['rows']),
+                                  dates.size - 1)
+                if np.any(is_occupied & (dates[rows] != deque['rows'])):
+                    return False
+                rows[~is_occupied] = 0
+                deque['rows'] = np.zeros((offset, rows.shape[1]),
+                                         dtype=np.int64)
+                deque['rows'][:rows.shape[0]] = rows
+
+        # Slide every window forward one row at a time, then recompute the
+        # sums which may have drifted.
+        fields = {'adj_close': prices, 'volume': volumes}
+        for window, sums in state['sums'].iteritems():
+            field, length, lag = window
+            is_stale = is_adjusted.copy() if field == 'adj_close' else (
+                np.zeros_like(is_adjusted))
+            for row in range(last_row + 1, dates.size):
+                end = row + 1
+                is_added, added = self._get_deviations(fields[field][
+                    end - lag - 1, :], state['shifts'][window])
+                is_removed, removed = self._get_deviations(fields[field][
+                    end - lag - length - 1, :], state['shifts'][window])
+                is_stale |= is_added != is_removed
+                sums[0] += is_added
+                sums[0] -= is_removed
+                sums[1] += added - removed
+                sums[2] += added * added - removed * removed
+            state['ages'][window] += dates.size - last_row - 1
+            if state['ages'][window] >= length:
+                is_stale[:] = True
+                state['ages'][window] = 0
+            if np.any(is_stale):
+                self._set_sums(state, window, fields[field], is_stale)
+        for row in range(last_row + 1, dates.size):
+            for offset in offsets:
+                self._push(state['highs'][offset], prices, row, offset, True)
+                self._push(state['lows'][offset], prices, row, offset, False)
+        return True
+
+    @staticmethod
+    def _push(deque, prices, row, offset, is_max):
+        """Pushes a row onto each symbol's monotonic deque for the window of
+        offset rows ending at that row, first dropping the row which left the
+        window from the front, then popping rows the new price supersedes
+        from the back, a round for as long as any symbol has one to pop.
+        """
+        rows, start, length = deque['rows'], deque['start'], deque['length']
+        capacity = rows.shape[0]
+        columns = np.arange(prices.shape[1])
+        is_expired = (length > 0) & (rows[start, columns] <= row - offset)
+        start[is_expired] = (start[is_expired] + 1) % capacity
+        length[is_expired] -= 1
+
+        row_prices = prices[row, :]
+        is_valid = ~np.isnan(row_prices)
+        is_popping = is_valid.copy()
+        while True:
+            is_popping &= length > 0
+            back_prices = prices[rows[(start + length - 1) % capacity,
+                                      columns], columns]
+            with np.errstate(invalid='ignore'):
+                if is_max:
+                    is_popping &= back_prices <= row_prices
+                else:
+                    is_popping &= back_prices >= row_prices
+            if not np.any(is_popping):
+                break
+            length[is_popping] -= 1
+        rows[((start + length) % capacity)[is_valid], columns[is_valid]] = row
+        length[is_valid] += 1
+
+    def _load(self):
+        """Returns the state in the file, or None if there is none.
+        """
+        if not os.path.exists(self._path):
+            return None
+        with open(self._path, 'rb') as input_file:
+            return pickle.load(input_file)
+
+    def _save(self, state, dates, prices, volumes):
+        """Writes the state for the last row of daily via a temporary file and
+        rename, with deques of rows converted to dates.
+        """
+        saved_state = dict(state)
+        saved_state['last_date'] = dates[-1]
+        saved_state['last_prices'] = prices[-1, :]
+        saved_state['last_volumes'] = volumes[-1, :]
+        for key in ('highs', 'lows'):
+            saved_state[key] = {}
+            for offset, deque in state[key].iteritems():
+                slots = np.arange(max(1, deque['length'].max()))
+                rows = deque['rows'][(deque['start'] + slots[:, np.newaxis]) % (
+                    offset), np.arange(deque['rows'].shape[1])]
+                saved_state[key][offset] = {
+                    'rows': dates[rows],
+                    'start': np.zeros_like(deque['start']),
+                    'length': deque['length'],
+                }
+        state_dir = os.path.dirname(self._path)
+        if state_dir and not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        temp_path = '{}.{}.tmp'.format(self._path, os.getpid())
+        with open(temp_path, 'wb') as output_file:
+            pickle.dump(saved_state, output_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self._path)
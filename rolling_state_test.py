@@ -0,0 +1,181 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for rolling_state.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import rolling_state
+import universe_report
+
+class RollingStateTest(unittest.TestCase):
+    """Tests for the rolling_state module.
+    """
+    _OFFSETS = [4, 5, 20, 61]
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._temp_dir, 'rolling_state.pickle')
+
+        # Random walks rounded to cents, with scattered nulls, a symbol which
+        # stops trading and a symbol which often repeats its price. Reports
+        # need a symbol at a high and one at a low.
+        random = np.random.RandomState(0)
+        shape = (160, 40)
+        self._prices = np.around(50.0 * np.cumprod(1.0 + (
+            .02 * random.randn(*shape)), axis=0), 2)
+        self._prices[:, -2] = np.arange(shape[0]) + 10.0
+        self._prices[:, -1] = shape[0] + 10.0 - np.arange(shape[0])
+        self._prices[random.randint(60, shape[0], 80), random.randint(
+            0, shape[1], 80)] = np.nan
+        self._prices[120:, 1] = np.nan
+        self._prices[::3, 2] = 50.0
+        self._volumes = random.randint(1, 10 ** 6, shape).astype(float)
+        self._volumes[random.randint(60, shape[0], 40), random.randint(
+            0, shape[1], 40)] = np.nan
+        self._dates = pd.bdate_range('20150101', periods=shape[0], name='Date')
+        self._symbols = ['S{:02d}'.format(x) for x in range(shape[1])]
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def _get_daily(self, row_count, prices=None):
+        """Returns daily of the first row_count rows.
+        """
+        prices = self._prices if prices is None else prices
+        return {
+            'adj_close': pd.DataFrame(prices[:row_count], index=self._dates[
+                :row_count], columns=self._symbols),
+            'volume': pd.DataFrame(self._volumes[:row_count], index=(
+                self._dates[:row_count]), columns=self._symbols),
+        }
+
+    def _get_state(self, path=None):
+        """Returns a RollingState for a path, by default that of the test,
+        which counts rebuilds.
+        """
+        state = rolling_state.RollingState(path or self._path)
+        state.build_count = 0
+        build = state._build
+        def count_build(*args):
+            state.build_count += 1
+            return build(*args)
+        state._build = count_build
+        return state
+
+    def _assert_stats_equal(self, stats, daily):
+        """Asserts stats equal those calculated over the whole of daily.
+        """
+        expected = universe_report.UniverseReport({}, daily)._calculate_stats(
+            self._OFFSETS)
+        for offset in self._OFFSETS:
+            for key in ('at_high', 'at_low'):
+                np.testing.assert_array_equal(stats[offset][key], expected[
+                    offset][key])
+            for key in ('volatility_change', 'volume_change'):
+                np.testing.assert_allclose(stats[offset][key], expected[
+                    offset][key], rtol=1e-7)
+
+    def test_consecutive_days(self):
+        for row_count in range(61, self._prices.shape[0] + 1):
+            state = self._get_state()
+            daily = self._get_daily(row_count)
+            self._assert_stats_equal(state.get_stats(daily, self._OFFSETS),
+                                     daily)
+            self.assertEqual(state.build_count, 1 if row_count == 61 else 0)
+
+    def test_report_matches_calculated_report(self):
+        config = {
+            'subject_format': 'Universe Report -- {}',
+            'body_returns': {},
+            'body_stats': dict((x, {'count': 5}) for x in self._OFFSETS),
+        }
+        state_config = dict(config, rolling_state_file=self._path)
+        for row_count in range(61, self._prices.shape[0] + 1):
+            daily = self._get_daily(row_count)
+            expected = universe_report.UniverseReport(config, daily)
+            self.assertEqual(universe_report.UniverseReport(
+                state_config, daily).get_report(), expected.get_report())
+
+    def test_adjusted_prices(self):
+        # Past prices of a symbol are halved from row 100, as for a split.
+        prices = self._prices.copy()
+        for row_count in range(61, self._prices.shape[0] + 1):
+            if row_count == 100:
+                prices[:, 3] *= .5
+            state = self._get_state()
+            daily = self._get_daily(row_count, prices)
+            self._assert_stats_equal(state.get_stats(daily, self._OFFSETS),
+                                     daily)
+            self.assertEqual(state.build_count, 1 if row_count == 61 else 0)
+
+    def test_sums_recomputed(self):
+        # Sums are recomputed exactly as when built when a null enters or
+        # leaves a window, and for every symbol once the window has turned
+        # over, so they match those of a new state.
+        self._get_state().get_stats(self._get_daily(100), self._OFFSETS)
+        prices = self._prices.copy()
+        prices[100, 5] = np.nan
+        for row_count in range(101, 141):
+            state = self._get_state()
+            state.get_stats(self._get_daily(row_count, prices), self._OFFSETS)
+            sums = state._load()['sums']
+            new_state = self._get_state(os.path.join(self._temp_dir, str(
+                row_count)))
+            new_state.get_stats(self._get_daily(row_count, prices),
+                                self._OFFSETS)
+            new_sums = new_state._load()['sums']
+            for window, length, lag in new_sums:
+                if window == 'adj_close' and row_count - lag == 101:
+                    np.testing.assert_array_equal(
+                        sums[window, length, lag][:, 5], new_sums[
+                            window, length, lag][:, 5])
+                if row_count - 100 == length:
+                    np.testing.assert_array_equal(sums[
+                        window, length, lag], new_sums[window, length, lag])
+
+    def test_rebuild(self):
+        # Each of these cannot be advanced from the state for 100 rows: other
+        # offsets, other symbols, a missing date, changed volume and a price
+        # which has become null.
+        volumes = self._volumes.copy()
+        volumes[99, 0] += 1.0
+        prices = self._prices.copy()
+        prices[99, 0] = np.nan
+        daily = self._get_daily(101)
+        for offsets, daily in [
+                (self._OFFSETS[:-1], daily),
+                (self._OFFSETS, dict((x, y.iloc[:, 1:]) for x, y in (
+                    daily.iteritems()))),
+                (self._OFFSETS, dict((x, y.drop(self._dates[99])) for x, y in (
+                    daily.iteritems()))),
+                (self._OFFSETS, dict(daily, volume=pd.DataFrame(volumes[
+                    :101], index=self._dates[:101], columns=self._symbols))),
+                (self._OFFSETS, self._get_daily(101, prices))]:
+            self._get_state().get_stats(self._get_daily(100), self._OFFSETS)
+            state = self._get_state()
+            self.assertEqual(sorted(state.get_stats(daily, offsets)), offsets)
+            self.assertEqual(state.build_count, 1)
+            os.remove(self._path)
+
+if __name__ == '__main__':
+    unittest.main()
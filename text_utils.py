@@ -14,11 +14,11 @@
 # ==============================================================================
 
 """This file contains util functions to assist in building text-based
-visualizations of numeric data.
+visualizations of numeric data. Output is built from lists of lines joined once,
+with format strings and widths computed once per call.
 """
 
 import numpy as np
-import pandas as pd
 
 def get_histogram(series, bins, bins_decimals=0, bins_is_percent=False,
                   block_count=100):
@@ -31,8 +31,23 @@ def get_histogram(series, bins, bins_decimals=0, bins_is_percent=False,
         bins_is_percent: Whether to print a '%' character for bins.
         block_count: Total number of block characters in histogram.
     """
-    histogram = ''
-    buckets = series.groupby(pd.cut(series, bins)).count()
+    return format_histogram(get_bin_counts(series.values, bins), bins,
+                            series.size, bins_decimals, bins_is_percent,
+                            block_count)
+
+def format_histogram(buckets, bins, value_count, bins_decimals=0,
+                     bins_is_percent=False, block_count=100):
+    """Creates a text-based histogram from counts of values in each bin, e.g.
+    those returned by get_bin_counts() summed over several sets of values.
+
+    Args:
+        buckets: numpy array of the number of values in each bin.
+        bins: List of boundaries between bins in ascending order.
+        value_count: Total number of values, including any not in bins.
+        bins_decimals: Number of decimals to use for bins in format string.
+        bins_is_percent: Whether to print a '%' character for bins.
+        block_count: Total number of block characters in histogram.
+    """
     scaled_bins = 100 * bins if bins_is_percent else bins
 
     # Find the max string length for an individual bin value so that right
@@ -44,15 +59,26 @@ def get_histogram(series, bins, bins_decimals=0, bins_is_percent=False,
     format_str = '  '.join(['{:' + str(max_bin_value_len) + '.' + str(
         bins_decimals) + ('f}%' if bins_is_percent else 'f}')] * 2) + (
             '  {:<' + str(len(str(buckets.max()))) + '}  {}\n')
-    for i in range(buckets.size):
-        # Due to rounding exact number of blocks may vary.
-        histogram += format_str.format(
-            scaled_bins[i],
-            scaled_bins[i + 1],
-            buckets[i],
-            ''.join(['*'] * np.round(
-                block_count * buckets[i] / series.size)))
-    return histogram
+
+    # Due to rounding exact number of blocks may vary.
+    block_counts = np.round(block_count * buckets / value_count).astype(int)
+    return ''.join([format_str.format(
+        scaled_bins[i], scaled_bins[i + 1], buckets[i], '*' * block_counts[i])
+                    for i in range(buckets.size)])
+
+def get_bin_counts(values, bins):
+    """Returns a numpy array of the number of values in each bin, where bins
+    include their right edge but not their left like pandas.cut() does. Nulls
+    and values outside of bins are not counted.
+
+    Args:
+        values: numpy array of numeric values.
+        bins: List of boundaries between bins in ascending order.
+    """
+    bins = np.asarray(bins)
+    positions = np.searchsorted(bins, values[~np.isnan(values)], 'left') - 1
+    positions = positions[(positions >= 0) & (positions < bins.size - 1)]
+    return np.bincount(positions, minlength=bins.size - 1)
 
 def get_column(series, decimals=1, is_percent=False):
     """Creates a text-based column with labels on the left and numeric values on
@@ -63,8 +89,6 @@ def get_column(series, decimals=1, is_percent=False):
         decimals: Number of decimals to use in format string.
         is_percent: Whether to print a '%' character for values.
     """
-    column = ''
-
     # Find max string length for labels and values so that right alignment works
     # properly.
     scaled_series = 100 * series if is_percent else series
@@ -74,9 +98,8 @@ def get_column(series, decimals=1, is_percent=False):
 
     format_str = ('{:<' + str(label_len) + '}  {:' + str(value_len) + '.' +
                   str(decimals) + 'f}' + ('%\n' if is_percent else '\n'))
-    for key, value in scaled_series.iteritems():
-        column += format_str.format(key, value)
-    return column
+    return ''.join([format_str.format(key, value) for key, value in (
+        scaled_series.iteritems())])
 
 def join_lines(columns, separator=''):
     """Joins an arbitrary number of multi-line strings side-by-side splitting on
@@ -89,14 +112,11 @@ def join_lines(columns, separator=''):
     """
     split_columns = [x.split('\n') for x in columns]
 
-    # Max line width for each input column.
-    widths = [max(x) for x in [[len(y) for y in z] for z in split_columns]]
-
-    result = ''
-    for i in range(max([len(x) for x in split_columns])):
-        for j, column in enumerate(split_columns):
-            result += ('{:<' + str(widths[j] + len(separator)) + '}').format(
-                '' if i > len(column) - 1 else column[i])
+    # Max line width for each input column, including the separator.
+    widths = [max([len(y) for y in x]) + len(separator) for x in split_columns]
 
-        result += '\n'
-    return result
+    # Pad short columns with empty lines so every row has a cell per column.
+    line_count = max([len(x) for x in split_columns])
+    padded_columns = [[y.ljust(widths[i]) for y in x] + [' ' * widths[i]] * (
+        line_count - len(x)) for i, x in enumerate(split_columns)]
+    return ''.join([''.join(x) + '\n' for x in zip(*padded_columns)])
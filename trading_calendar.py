@@ -0,0 +1,125 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Contains functions for determining trading sessions of US equity exchanges
+(NYSE and NASDAQ) from their regular holiday rules. Dates are strings of format
+YYYYMMDD. Unscheduled closures, e.g. for weather, are not known ahead of time
+and may be passed in as extra_closures, which may also hold datetime.date
+objects or integers as loaded from YAML.
+
+Example:
+    import trading_calendar
+    trading_calendar.is_session('20160118')  # False, MLK Day.
+    trading_calendar.get_last_session('20160117')  # '20160115'
+"""
+
+import datetime
+
+_DATE_FORMAT = '%Y%m%d'
+_SATURDAY = 5
+_SUNDAY = 6
+
+def _get_nth_weekday(year, month, weekday, n):
+    """Returns the nth (1-based) given weekday of a month, or the last if n is
+    -1. Weekdays are numbered from Monday as 0.
+    """
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(
+            days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - datetime.timedelta(days=1)
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+def _get_easter(year):
+    """Returns Easter Sunday of a year using the anonymous Gregorian algorithm.
+    """
+    a = year % 19
+    b = year // 100
+    c = year % 100
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - b // 4 - g + 15) % 30
+    l = (32 + 2 * (b % 4) + 2 * (c // 4) - h - c % 4) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    n = h + l - 7 * m + 114
+    return datetime.date(year, n // 31, n % 31 + 1)
+
+def _get_observed(date):
+    """Returns the weekday a fixed-date holiday is observed on. Saturday moves
+    to Friday and Sunday moves to Monday.
+    """
+    if date.weekday() == _SATURDAY:
+        return date - datetime.timedelta(days=1)
+    if date.weekday() == _SUNDAY:
+        return date + datetime.timedelta(days=1)
+    return date
+
+def get_holidays(year):
+    """Returns the set of weekday holidays in a year as datetime.date objects.
+
+    Args:
+        year: Calendar year.
+    """
+    holidays = set([
+        _get_nth_weekday(year, 2, 0, 3),  # Washington's Birthday.
+        _get_easter(year) - datetime.timedelta(days=2),  # Good Friday.
+        _get_nth_weekday(year, 5, 0, -1),  # Memorial Day.
+        _get_observed(datetime.date(year, 7, 4)),  # Independence Day.
+        _get_nth_weekday(year, 9, 0, 1),  # Labor Day.
+        _get_nth_weekday(year, 11, 3, 4),  # Thanksgiving Day.
+        _get_observed(datetime.date(year, 12, 25)),  # Christmas Day.
+    ])
+
+    # New Year's Day on a Saturday is not observed on the prior Friday, since
+    # that would close the market on the last day of the previous year.
+    new_years_day = datetime.date(year, 1, 1)
+    if new_years_day.weekday() != _SATURDAY:
+        holidays.add(_get_observed(new_years_day))
+    if year >= 1998:
+        holidays.add(_get_nth_weekday(year, 1, 0, 3))  # MLK Day.
+    if year >= 2022:
+        holidays.add(_get_observed(datetime.date(year, 6, 19)))  # Juneteenth.
+    return holidays
+
+def _get_closures(extra_closures):
+    """Returns the set of extra closures as dates of format YYYYMMDD.
+    """
+    return set(x.strftime(_DATE_FORMAT) if isinstance(x, datetime.date) else (
+        str(x).replace('-', '')) for x in extra_closures)
+
+def is_session(date, extra_closures=()):
+    """Returns whether a date is a trading session.
+
+    Args:
+        date: Date of format YYYYMMDD.
+        extra_closures: Dates of unscheduled closures.
+    """
+    parsed_date = datetime.datetime.strptime(date, _DATE_FORMAT).date()
+    return parsed_date.weekday() < _SATURDAY and (
+        parsed_date not in get_holidays(parsed_date.year)) and (
+            date not in _get_closures(extra_closures))
+
+def get_last_session(date, extra_closures=()):
+    """Returns the last trading session on or before a date.
+
+    Args:
+        date: Date of format YYYYMMDD.
+        extra_closures: Dates of unscheduled closures.
+    """
+    extra_closures = _get_closures(extra_closures)
+    parsed_date = datetime.datetime.strptime(date, _DATE_FORMAT).date()
+    while not is_session(parsed_date.strftime(_DATE_FORMAT), extra_closures):
+        parsed_date -= datetime.timedelta(days=1)
+    return parsed_date.strftime(_DATE_FORMAT)
@@ -0,0 +1,45 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for trading_calendar.
+"""
+
+import datetime
+import unittest
+
+import trading_calendar
+
+class TradingCalendarTest(unittest.TestCase):
+    """Tests for the trading_calendar module.
+    """
+    def test_get_last_session(self):
+        self.assertEqual(trading_calendar.get_last_session('20160118'),
+                         '20160115')
+        self.assertEqual(trading_calendar.get_last_session('20160119'),
+                         '20160119')
+
+    def test_extra_closures_as_loaded_from_yaml(self):
+        # Hurricane Sandy closed the market on 20121029 and 20121030.
+        for extra_closures in [['20121029', '20121030'],
+                               [20121029, 20121030],
+                               [datetime.date(2012, 10, 29),
+                                datetime.date(2012, 10, 30)]]:
+            self.assertFalse(trading_calendar.is_session(
+                '20121030', extra_closures))
+            self.assertEqual(trading_calendar.get_last_session(
+                '20121030', extra_closures), '20121026')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -30,15 +30,43 @@ Example:
             20: {'bins_start': -.5, 'bins_stop': .55, 'bins_step': .05, },
         },
         'body_stats': {
-            1: {'count': 10, },
+            20: {'count': 10, },
+            250: {'count': 10, },
         },
+        'rolling_state_file': 'universe_data/rolling_state.pickle',
     }, daily).get_report()
+
+If rolling_state_file is set, stats for offsets in body_stats are served by a
+rolling_state.RollingState kept in that file, which is updated incrementally as
+new days are added to daily instead of recomputed over every period.
+
+A universe can also be split into shards of symbols, each reduced by its own
+process or host to a partial report of mergeable aggregates: histogram counts,
+the most extreme returns and stats, and symbols at highs and lows. Partials of
+all shards are merged and formatted into the same report as for the whole
+universe. Shards must share the same dates.
+
+Example:
+    # On each shard.
+    report = universe_report.UniverseReport(universe_report_config,
+                                            shard_daily)
+    universe_report.save_partial(report.get_partial(), 'shards/0.pickle')
+
+    # On the coordinator.
+    partial = universe_report.merge_partials([universe_report.load_partial(
+        'shards/{}.pickle'.format(x)) for x in range(shard_count)])
+    print universe_report.format_report(universe_report_config, partial)
 """
 
+import cPickle as pickle
+import hashlib
+import os
 import sys
 
 import numpy as np
+import pandas as pd
 
+import rolling_state
 import text_utils
 
 class UniverseReport(object):
@@ -56,6 +84,193 @@ class UniverseReport(object):
         """
         self._config = universe_report_config
         self._daily = daily
+        self._returns = None
+        self._returns_rows = {}
+        self._stats = {}
+
+    def _get_returns(self, offset):
+        """Returns a pandas.Series of returns of each symbol over offset rows
+        (days). Returns for every offset in body_returns of config are computed
+        together as a (horizons, symbols) matrix in one pass over the price
+        array, and cached.
+        """
+        if offset not in self._returns_rows:
+            offsets = sorted(set(self._config.get('body_returns', {})) | set(
+                self._returns_rows) | set([offset]))
+            prices = self._daily['adj_close'].values
+            start_prices = prices[-(np.array(offsets) + 1), :]
+            self._returns = (prices[-1, :] - start_prices) / start_prices
+            self._returns_rows = dict((x, i) for i, x in enumerate(offsets))
+        return pd.Series(self._returns[self._returns_rows[offset]],
+                         index=self._daily['adj_close'].columns)
+
+    def _get_stats(self, offset):
+        """Returns a dict of numpy arrays of per-symbol stats over offset rows
+        (days), as described in _calculate_stats(). Stats for every offset in
+        body_stats of config are calculated together, and cached. If
+        rolling_state_file is in config, those in body_stats come from the
+        rolling state instead.
+        """
+        body_stats = self._config.get('body_stats', {})
+        if offset not in self._stats:
+            if 'rolling_state_file' in self._config and offset in body_stats:
+                self._stats.update(rolling_state.RollingState(self._config[
+                    'rolling_state_file']).get_stats(self._daily, list(
+                        body_stats)))
+            else:
+                self._stats.update(self._calculate_stats(sorted(set(
+                    body_stats) - set(self._stats) | set([offset]))))
+        return self._stats[offset]
+
+    def _calculate_stats(self, offsets):
+        """Returns a dict keyed by offset of dicts of numpy arrays with one
+        value per symbol:
+            at_high, at_low: Whether the last price is the max (min) of the
+                last offset prices.
+            volatility_change: Price stdev over the first half of the period
+                divided by that over the second half, where the halves share
+                their middle day because we care about differences across days.
+            volume_change: Volume sum over the first half of the period divided
+                by that over the second half.
+        All offsets are served by one pass over the most recent rows from the
+        last row backwards, keeping running extremes and suffix sums, and
+        recording them at the rows where periods and their halves start.
+        Prices are offset by the last price before summing squares to limit
+        rounding error, and stdevs are found as by rolling_state, so they match.
+        Nulls are skipped like pandas does.
+        """
+        prices = self._daily['adj_close'].values
+        volumes = self._daily['volume'].values
+        period_end = prices.shape[0]
+        boundaries = {}
+        for offset in offsets:
+            period_midpoint = period_end - int(np.around(offset * .5))
+            boundaries[offset] = (period_end - offset, period_midpoint - 1,
+                                  period_midpoint)
+        needed_rows = set(x for y in boundaries.values() for x in y)
+
+        # Running price count, sum, sum of squares and volume sum over rows
+        # [row, period_end), recorded with at high and low for needed rows.
+        last_prices = prices[-1, :]
+        shift = np.nan_to_num(last_prices)
+        high = np.full(prices.shape[1], np.nan)
+        low = np.full(prices.shape[1], np.nan)
+        current = np.zeros((4, prices.shape[1]))
+        recorded = {}
+        with np.errstate(invalid='ignore'):
+            for row in range(period_end - 1, min(needed_rows) - 1, -1):
+                deviations = prices[row, :] - shift
+                is_valid = ~np.isnan(deviations)
+                deviations[~is_valid] = 0.0
+                current[0] += is_valid
+                current[1] += deviations
+                current[2] += deviations * deviations
+                current[3] += np.nan_to_num(volumes[row, :])
+                np.fmax(high, prices[row, :], out=high)
+                np.fmin(low, prices[row, :], out=low)
+                if row in needed_rows:
+                    recorded[row] = (current.copy(), high == last_prices, (
+                        low == last_prices))
+
+        def get_std(start, stop):
+            """Returns the sample stdev of prices over rows [start, stop).
+            """
+            return rolling_state.get_std(recorded[start][0] - (
+                recorded[stop][0] if stop < period_end else 0.0))
+
+        stats = {}
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for offset in offsets:
+                period_start, second_start, period_midpoint = boundaries[
+                    offset]
+                stats[offset] = {
+                    'at_high': recorded[period_start][1],
+                    'at_low': recorded[period_start][2],
+                    'volatility_change': get_std(
+                        period_start, period_midpoint) / get_std(
+                            second_start, period_end),
+                    'volume_change': (recorded[period_start][0][3] - (
+                        recorded[period_midpoint][0][3])) / (
+                            recorded[period_midpoint][0][3]),
+                }
+        return stats
+
+    @staticmethod
+    def _get_sorted_positions(values, symbols, count, ascending=True):
+        """Returns the positions of the first count values in the order of
+        pandas.Series.sort_values(), i.e. with nulls last, found by partial
+        selection instead of a full sort. Ties are ordered by symbol, as in
+        merge_partials().
+
+        Args:
+            values: numpy array of numeric values.
+            symbols: numpy array of the symbol of each value.
+            count: Number of positions to return, at most values.size.
+            ascending: Whether to sort in ascending order.
+        """
+        keys = values if ascending else -values
+        count = max(0, min(count, keys.size))
+        if count == 0:
+            return np.array([], dtype=np.int64)
+
+        # Keep every value tied with the last one selected, so ties at the
+        # cutoff are also decided by symbol.
+        positions = np.arange(keys.size)
+        if count < keys.size:
+            cutoff = keys[np.argpartition(keys, count - 1)[count - 1]]
+            if not np.isnan(cutoff):
+                with np.errstate(invalid='ignore'):
+                    positions = np.flatnonzero(keys <= cutoff)
+        return positions[np.lexsort((symbols[positions], keys[positions]))][
+            :count]
+
+    def _get_returns_partial(self, offset, bins, is_extensible=True):
+        """Returns a dict of mergeable aggregates of returns over offset rows
+        (days), from which format_returns_section() creates the section:
+            bins, is_extensible: Bins of the histogram, and whether bins are
+                added at either end if needed to count all returns.
+            size, null_count: Number of returns, and of those null.
+            counts: Number of returns in each bin.
+            under, over: Number of returns at most the first bin boundary and
+                above the last.
+            min, min_count, max: Extreme returns, and number of the min.
+            losers, winners: Lists of (symbol, return) of the most extreme
+                returns in order, with nulls last for losers and ties ordered
+                by symbol. There are enough for a histogram with bins added at
+                both ends.
+            last_nulls: Last symbols in order with null returns, as many.
+        """
+        returns = self._get_returns(offset)
+        values = returns.values
+        symbols = np.array([str(x) for x in returns.index])
+        is_null = np.isnan(values)
+        valid_values = values[~is_null]
+        extreme_count = int(np.floor((bins.size + 1) * .5)) - 1
+        partial = {
+            'bins': bins,
+            'is_extensible': is_extensible,
+            'size': values.size,
+            'null_count': np.count_nonzero(is_null),
+            'counts': text_utils.get_bin_counts(values, bins),
+            'under': np.count_nonzero(valid_values <= bins[0]),
+            'over': np.count_nonzero(valid_values > bins[-1]),
+            'min': np.nan,
+            'min_count': 0,
+            'max': np.nan,
+            'losers': [(symbols[x], values[x]) for x in (
+                self._get_sorted_positions(values, symbols, extreme_count))],
+            'winners': [(symbols[x], values[x]) for x in (
+                self._get_sorted_positions(values, symbols, extreme_count, (
+                    False))) if not is_null[x]],
+            'last_nulls': sorted(symbols[is_null])[-extreme_count:] if (
+                extreme_count > 0) else [],
+        }
+        if valid_values.size > 0:
+            partial['min'] = valid_values.min()
+            partial['min_count'] = np.count_nonzero(
+                valid_values == partial['min'])
+            partial['max'] = valid_values.max()
+        return partial
 
     def get_returns_section(self, offset, bins=None):
         """Creates a multi-line string containing a column of top winners and
@@ -65,39 +280,37 @@ class UniverseReport(object):
             offset: Number of rows (days) back to go when calculating returns.
             bins: List of boundaries between histogram bins in ascending order.
         """
-        returns = ((self._daily['adj_close'].iloc[-1, :] - (
-            self._daily['adj_close'].iloc[-(offset + 1), :])) / (
-                self._daily['adj_close'].iloc[-(offset + 1), :])).sort_values()
-
         # If no bins provided, create default of 20 equally spaced bins.
         if bins is None:
+            returns = self._get_returns(offset)
             bins = np.arange(returns.min() - sys.float_info.epsilon,
                              returns.max() + sys.float_info.epsilon,
                              .05 * (returns.max() - returns.min()))
-        else:
-            # Possibly add bins at either end to ensure all values are counted.
-            if returns.min() < bins.min():
-                bins = np.insert(bins, 0, returns.min() - (
-                    sys.float_info.epsilon))
-            if returns.max() > bins.max():
-                bins = np.append(bins, returns.max() + sys.float_info.epsilon)
-
-        returns_hist = text_utils.get_histogram(returns, bins, 0, True)
-
-        # If there is space for winners and losers and at least one empty line
-        # separating them, then include them.
-        extreme_count = int(np.floor((bins.size - 1) * .5)) - 1
-        if extreme_count > 0:
-            returns_col = text_utils.get_column(returns[:extreme_count], 1, (
-                True))
-            returns_col += ''.join('\n' * (bins.size - 2 * extreme_count - (
-                1)))
-            returns_col += text_utils.get_column(returns[-extreme_count:], 1, (
-                True))
-        else:
-            returns_col = ''
-
-        return text_utils.join_lines([returns_col, returns_hist], '    ')
+            return format_returns_section(self._get_returns_partial(
+                offset, bins, False))
+        return format_returns_section(self._get_returns_partial(offset, bins))
+
+    def _get_stats_partial(self, offset, count):
+        """Returns a dict of mergeable aggregates of stats over offset rows
+        (days), from which format_stats_section() creates the section:
+            at_high, at_low: Lists of (symbol, last price) of symbols with the
+                last price at a max or min for the period, ordered by symbol.
+            count: Number of changes to include.
+            volatility_change, volume_change: Lists of (symbol, change) of the
+                count largest changes in descending order, with nulls last and
+                ties ordered by symbol.
+        """
+        stats = self._get_stats(offset)
+        symbols = np.array([str(x) for x in self._daily['adj_close'].columns])
+        last_prices = self._daily['adj_close'].values[-1, :]
+        partial = {'count': count}
+        for key in ('at_high', 'at_low'):
+            partial[key] = sorted((symbols[x], last_prices[x]) for x in (
+                np.flatnonzero(stats[key])))
+        for key in ('volatility_change', 'volume_change'):
+            partial[key] = [(symbols[x], stats[key][x]) for x in (
+                self._get_sorted_positions(stats[key], symbols, count, False))]
+        return partial
 
     def get_stats_section(self, offset, count):
         """Creates a multi-line string with several columns of stats about the
@@ -108,60 +321,212 @@ class UniverseReport(object):
                 This must be at least 4 so that there are 2 periods to compare.
             count: Number of values to include for volatility and volume.
         """
-        period_end = self._daily['adj_close'].shape[0]
-        period_start = period_end - offset
-        period_midpoint = period_end - int(np.around(offset * .5))
-
-        # Prices with the most recent value at a max or min for the period.
-        price_at_high_cols = self._daily['adj_close'].iloc[
-            period_start:, :].max(axis=0) == self._daily['adj_close'].iloc[
-                -1, :]
-        price_at_high = 'At High\n' + text_utils.get_column(
-            self._daily['adj_close'].ix[-1, price_at_high_cols], 2)
-        price_at_low_cols = self._daily['adj_close'].iloc[
-            period_start:, :].min(axis=0) == self._daily['adj_close'].iloc[
-                -1, :]
-        price_at_low = 'At Low\n' + text_utils.get_column(
-            self._daily['adj_close'].ix[-1, price_at_low_cols], 2)
-
-        # Change in price stdev from the first to second half of the period.
-        # Ranges are inclusive because we care about differences across days.
-        first_range = range(period_start, period_midpoint)
-        second_range = range(period_midpoint - 1, period_end)
-        volatility_change = self._daily['adj_close'].iloc[first_range, :].std(
-            axis=0) / (self._daily['adj_close'].iloc[second_range, :].std(
-                axis=0))
-        volatility_change = 'Volatility Chg\n' + text_utils.get_column(
-            volatility_change.sort_values(ascending=False)[range(count)], 2, (
-                True))
-
-        # Change in volume from the first to second half of the period.
-        # Ranges are not inclusive since we are summing volume for each day.
-        first_range = range(period_start, period_midpoint)
-        second_range = range(period_midpoint, period_end)
-        volume_change = self._daily['volume'].iloc[first_range, :].sum(
-            axis=0) / (self._daily['volume'].iloc[second_range, :].sum(axis=0))
-        volume_change = 'Volume Chg\n' + text_utils.get_column(
-            volume_change.sort_values(ascending=False)[range(count)], 2, True)
-
-        return text_utils.join_lines([price_at_high, price_at_low, (
-            volatility_change), volume_change], '    ')
+        return format_stats_section(self._get_stats_partial(offset, count))
 
-    def get_report(self):
-        """Creates the entire report including returns and stats sections
-        determined by the config.
+    def get_partial(self):
+        """Returns a dict of the mergeable aggregates of every section of the
+        report determined by the config, for merge_partials() and
+        format_report().
         """
-        subject = self._config['subject_format'].format(str(
-            self._daily['adj_close'].index[-1].date()))
-        plain_body = ''
+        dates = self._daily['adj_close'].index
+        partial = {
+            'date': str(dates[-1].date()),
+            'row_count': dates.size,
+            'dates_digest': hashlib.md5(dates.values.astype(
+                'datetime64[ns]').view(np.int64).tobytes()).hexdigest(),
+            'returns': {},
+            'stats': {},
+        }
         for key, value in self._config['body_returns'].iteritems():
-            plain_body += '{} Day Returns\n'.format(str(key))
-            plain_body += '-' * (12 + len(str(key))) + '\n'
-            plain_body += self.get_returns_section(key, np.arange(
+            partial['returns'][key] = self._get_returns_partial(key, np.arange(
                 float(value['bins_start']), float(value['bins_stop']),
                 float(value['bins_step'])))
         for key, value in self._config['body_stats'].iteritems():
-            plain_body += '{} Day Stats\n'.format(str(key))
-            plain_body += '-' * (10 + len(str(key))) + '\n'
-            plain_body += self.get_stats_section(key, value['count'])
-        return {'subject': subject, 'plain_body': plain_body}
+            partial['stats'][key] = self._get_stats_partial(key, value[
+                'count'])
+        return partial
+
+    def get_report(self):
+        """Creates the entire report including returns and stats sections
+        determined by the config.
+        """
+        return format_report(self._config, self.get_partial())
+
+def _get_series(items):
+    """Returns a pandas.Series from a list of (symbol, value).
+    """
+    return pd.Series([x[1] for x in items], index=[x[0] for x in items])
+
+def _get_sort_key(ascending):
+    """Returns a sort key for (symbol, value) in the order of values, with
+    nulls last and ties ordered by symbol.
+    """
+    sign = 1.0 if ascending else -1.0
+    return lambda x: (np.isnan(x[1]), sign * x[1] if not np.isnan(x[1]) else (
+        0.0), x[0])
+
+def format_returns_section(partial):
+    """Creates the multi-line string of UniverseReport.get_returns_section()
+    from a partial of the type returned by _get_returns_partial().
+
+    Args:
+        partial: dict of aggregates of returns over one offset.
+    """
+    bins = partial['bins']
+    counts = partial['counts']
+
+    # Possibly add bins at either end to ensure all values are counted. Values
+    # equal to the min are only in the added bin if subtracting epsilon from
+    # the min changes it.
+    if partial['is_extensible']:
+        if partial['min'] < bins.min():
+            min_bin = partial['min'] - sys.float_info.epsilon
+            bins = np.insert(bins, 0, min_bin)
+            counts = np.insert(counts, 0, partial['under'] - (
+                partial['min_count'] if min_bin == partial['min'] else 0))
+        if partial['max'] > bins.max():
+            bins = np.append(bins, partial['max'] + sys.float_info.epsilon)
+            counts = np.append(counts, partial['over'])
+
+    returns_hist = text_utils.format_histogram(counts, bins, partial['size'],
+                                               0, True)
+
+    # If there is space for winners and losers and at least one empty line
+    # separating them, then include them. These are the ends of returns in
+    # ascending order with nulls last, so any nulls end the winners.
+    extreme_count = int(np.floor((bins.size - 1) * .5)) - 1
+    if extreme_count > 0:
+        winner_count = min(extreme_count, partial['size'])
+        null_count = min(winner_count, partial['null_count'])
+        winners = partial['winners'][:winner_count - null_count][::-1]
+        if null_count > 0:
+            winners += [(x, np.nan) for x in partial['last_nulls'][
+                -null_count:]]
+        returns_col = text_utils.get_column(_get_series(partial['losers'][
+            :extreme_count]), 1, True)
+        returns_col += '\n' * (bins.size - 2 * extreme_count - 1)
+        returns_col += text_utils.get_column(_get_series(winners), 1, True)
+    else:
+        returns_col = ''
+
+    return text_utils.join_lines([returns_col, returns_hist], '    ')
+
+def format_stats_section(partial):
+    """Creates the multi-line string of UniverseReport.get_stats_section() from
+    a partial of the type returned by _get_stats_partial().
+
+    Args:
+        partial: dict of aggregates of stats over one offset.
+    """
+    # Prices with the most recent value at a max or min for the period.
+    price_at_high = 'At High\n' + text_utils.get_column(_get_series(partial[
+        'at_high']), 2)
+    price_at_low = 'At Low\n' + text_utils.get_column(_get_series(partial[
+        'at_low']), 2)
+
+    # Change in price stdev from the first to second half of the period.
+    volatility_change = 'Volatility Chg\n' + text_utils.get_column(
+        _get_series(partial['volatility_change']), 2, True)
+
+    # Change in volume from the first to second half of the period.
+    volume_change = 'Volume Chg\n' + text_utils.get_column(_get_series(
+        partial['volume_change']), 2, True)
+
+    return text_utils.join_lines([price_at_high, price_at_low, (
+        volatility_change), volume_change], '    ')
+
+def format_report(config, partial):
+    """Creates the entire report from a partial of the type returned by
+    UniverseReport.get_partial() or merge_partials().
+
+    Args:
+        config: universe_report_config the partial was created with.
+        partial: dict of aggregates of every section of the report.
+    """
+    subject = config['subject_format'].format(partial['date'])
+    plain_body = ''
+    for key in config['body_returns']:
+        plain_body += '{} Day Returns\n'.format(str(key))
+        plain_body += '-' * (12 + len(str(key))) + '\n'
+        plain_body += format_returns_section(partial['returns'][key])
+    for key in config['body_stats']:
+        plain_body += '{} Day Stats\n'.format(str(key))
+        plain_body += '-' * (10 + len(str(key))) + '\n'
+        plain_body += format_stats_section(partial['stats'][key])
+    return {'subject': subject, 'plain_body': plain_body}
+
+def merge_partials(partials):
+    """Returns a partial of the type returned by UniverseReport.get_partial()
+    for the union of the symbols of several, e.g. one per shard.
+
+    Args:
+        partials: List of dicts of aggregates of disjoint sets of symbols,
+            created with the same config. They must have exactly the same
+            dates, which is checked by their number and a digest of them.
+    """
+    for field in ('date', 'row_count', 'dates_digest'):
+        values = set(x[field] for x in partials)
+        if len(values) != 1:
+            raise ValueError('Partials have different dates, {}: {}'.format(
+                field, ', '.join(sorted(str(x) for x in values))))
+    merged = dict((x, partials[0][x]) for x in (
+        'date', 'row_count', 'dates_digest'))
+    merged.update({'returns': {}, 'stats': {}})
+
+    for key, first in partials[0]['returns'].iteritems():
+        sections = [x['returns'][key] for x in partials]
+        if any(not np.array_equal(x['bins'], first['bins']) for x in sections):
+            raise ValueError('Partials have different bins: ' + str(key))
+        extreme_count = int(np.floor((first['bins'].size + 1) * .5)) - 1
+        mins = [x['min'] for x in sections if not np.isnan(x['min'])]
+        maxes = [x['max'] for x in sections if not np.isnan(x['max'])]
+        section = {
+            'bins': first['bins'],
+            'is_extensible': first['is_extensible'],
+            'min': min(mins) if mins else np.nan,
+            'max': max(maxes) if maxes else np.nan,
+            'losers': sorted(sum([x['losers'] for x in sections], []), key=(
+                _get_sort_key(True)))[:extreme_count],
+            'winners': sorted(sum([x['winners'] for x in sections], []), key=(
+                _get_sort_key(False)))[:extreme_count],
+            'last_nulls': sorted(sum([x['last_nulls'] for x in sections], []))[
+                -extreme_count:] if extreme_count > 0 else [],
+        }
+        for field in ('size', 'null_count', 'counts', 'under', 'over'):
+            section[field] = sum(x[field] for x in sections)
+        section['min_count'] = sum(x['min_count'] for x in sections if (
+            x['min'] == section['min']))
+        merged['returns'][key] = section
+
+    for key, first in partials[0]['stats'].iteritems():
+        sections = [x['stats'][key] for x in partials]
+        section = {'count': first['count']}
+        for field in ('at_high', 'at_low'):
+            section[field] = sorted(sum([x[field] for x in sections], []))
+        for field in ('volatility_change', 'volume_change'):
+            section[field] = sorted(sum([x[field] for x in sections], []), key=(
+                _get_sort_key(False)))[:first['count']]
+        merged['stats'][key] = section
+    return merged
+
+def save_partial(partial, path):
+    """Writes a partial via a temporary file and rename, so a coordinator never
+    reads it partially written.
+
+    Args:
+        partial: dict of the type returned by UniverseReport.get_partial().
+        path: Path of the file to write.
+    """
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as output_file:
+        pickle.dump(partial, output_file, pickle.HIGHEST_PROTOCOL)
+    os.rename(temp_path, path)
+
+def load_partial(path):
+    """Returns a partial written by save_partial().
+
+    Args:
+        path: Path of the file to read.
+    """
+    with open(path, 'rb') as input_file:
+        return pickle.load(input_file)
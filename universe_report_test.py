@@ -0,0 +1,88 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for universe_report.
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import universe_report
+
+class UniverseReportTest(unittest.TestCase):
+    """Tests for the universe_report module.
+    """
+    _CONFIG = {
+        'subject_format': 'Universe Report -- {}',
+        'body_returns': {
+            1: {'bins_start': -.1, 'bins_stop': .11, 'bins_step': .02},
+            20: {'bins_start': -.5, 'bins_stop': .55, 'bins_step': .05},
+        },
+        'body_stats': {20: {'count': 5}},
+    }
+
+    def setUp(self):
+        # Prices rounded to dollars tie often, and columns are not in symbol
+        # order, so ties are only ordered alike if ordered by symbol.
+        random = np.random.RandomState(0)
+        shape = (60, 60)
+        prices = np.around(20.0 * np.cumprod(1.0 + (
+            .03 * random.randn(*shape)), axis=0))
+        prices[random.rand(*shape) < .05] = np.nan
+        prices[:, -2] = np.arange(shape[0]) + 10.0
+        prices[:, -1] = shape[0] + 10.0 - np.arange(shape[0])
+        volumes = np.around(random.rand(*shape), 1) * 1000 + 100
+        dates = pd.bdate_range('20150101', periods=shape[0], name='Date')
+        symbols = ['S{:02d}'.format(x) for x in random.permutation(shape[1])]
+        self._daily = {
+            'adj_close': pd.DataFrame(prices, index=dates, columns=symbols),
+            'volume': pd.DataFrame(volumes, index=dates, columns=symbols),
+        }
+
+    def _get_partials(self, shard_count):
+        """Returns the partial of each shard of symbols in column order.
+        """
+        return [universe_report.UniverseReport(self._CONFIG, dict((
+            x, y.iloc[:, i::shard_count]) for x, y in (
+                self._daily.iteritems()))).get_partial() for i in range(
+                    shard_count)]
+
+    def test_merged_report_matches_report(self):
+        expected = universe_report.UniverseReport(
+            self._CONFIG, self._daily).get_report()
+        for shard_count in (1, 2, 3, 7):
+            self.assertEqual(universe_report.format_report(
+                self._CONFIG, universe_report.merge_partials(
+                    self._get_partials(shard_count))), expected)
+
+    def test_merge_rejects_different_dates(self):
+        # Both end on the same date as the other partials, but one has fewer
+        # rows, and the other has the same number of rows with one moved.
+        dates = self._daily['adj_close'].index
+        moved_dates = dates.drop(dates[1]).insert(0, dates[0] - pd.Timedelta(
+            days=3))
+        for daily in [
+                dict((x, y.iloc[1:]) for x, y in self._daily.iteritems()),
+                dict((x, y.set_axis(moved_dates, inplace=False)) for x, y in (
+                    self._daily.iteritems()))]:
+            partials = self._get_partials(2) + [universe_report.UniverseReport(
+                self._CONFIG, daily).get_partial()]
+            with self.assertRaises(ValueError):
+                universe_report.merge_partials(partials)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright 2016 Peter Dymkar Brandt All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Contains util functions for validating daily dataframes. Every check is
+computed for a block of symbols at a time while its rows are in cache, and the
+results are combined into one status bitmask per symbol. Symbols with any bit of
+DROP_MASK set have unusable data, while the other bits are diagnostics only.
+
+Example:
+    import validation_utils
+    status = validation_utils.get_status(daily, '20160115', {
+        'max_stale_days': 10,  # Optional.
+        'max_abs_return': 1.0,  # Optional.
+    })
+    for flag, description in validation_utils.FLAGS:
+        print description, status.index[(status & flag) != 0]
+"""
+
+import numpy as np
+import pandas as pd
+
+NULL_PRICE = 1
+NULL_VOLUME = 2
+ZERO_VOLUME = 4
+STALE_PRICE = 8
+EXTREME_JUMP = 16
+MISSING_END = 32
+DROP_MASK = NULL_PRICE | NULL_VOLUME | ZERO_VOLUME
+FLAGS = (
+    (NULL_PRICE, 'Price data contains nulls'),
+    (NULL_VOLUME, 'Volume data contains nulls'),
+    (ZERO_VOLUME, 'Volume data contains zeros'),
+    (STALE_PRICE, 'Price data is stale'),
+    (EXTREME_JUMP, 'Price data contains extreme jumps'),
+    (MISSING_END, 'Data is missing end date'),
+)
+
+_BLOCK_SIZE = 256
+
+def get_status(daily, end_date, config=None):
+    """Returns a pandas.Series of uint8 status bitmasks indexed by symbol, zero
+    for symbols which pass every check.
+
+    Args:
+        daily: dict of pandas.DataFrame of the type returned by
+            historical_data.get_daily().
+        end_date: Date every symbol should have data for, of format YYYYMMDD.
+        config: Optional dict with max_stale_days, the number of consecutive
+            days of unchanged close which marks it stale, and max_abs_return,
+            the largest absolute daily change of adj_close.
+    """
+    config = {} if config is None else config
+    max_stale_days = config.get('max_stale_days', 10)
+    max_abs_return = config.get('max_abs_return', 1.0)
+    symbols = daily['close'].columns
+
+    # Arrays are (symbols, dates), which for dataframes from
+    # ingest_utils.build_frames() is the contiguous layout of their data.
+    close = daily['close'].values.T
+    adj_close = daily['adj_close'].values.T
+    volume = daily['volume'].values.T
+    has_end = daily['close'].shape[0] > 0 and (
+        daily['close'].index[-1] == pd.to_datetime(end_date))
+
+    status = np.zeros(len(symbols), dtype=np.uint8)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for start in range(0, len(symbols), _BLOCK_SIZE):
+            stop = min(start + _BLOCK_SIZE, len(symbols))
+            block_close = close[start:stop]
+            block_adj_close = adj_close[start:stop]
+            block_volume = volume[start:stop]
+            block_status = status[start:stop]
+
+            is_null_close = np.isnan(block_close)
+            block_status[is_null_close.any(axis=1) | np.isnan(
+                block_adj_close).any(axis=1)] |= NULL_PRICE
+            block_status[np.isnan(block_volume).any(axis=1)] |= NULL_VOLUME
+            block_status[(block_volume == 0).any(axis=1)] |= ZERO_VOLUME
+            if not has_end:
+                block_status |= MISSING_END
+            elif is_null_close.shape[1] > 0:
+                block_status[is_null_close[:, -1]] |= MISSING_END
+
+            # Close is stale if some window of max_stale_days consecutive
+            # changes are all zero, found from a running count of zeros.
+            is_unchanged = block_close[:, 1:] == block_close[:, :-1]
+            if is_unchanged.shape[1] >= max_stale_days:
+                unchanged_count = np.zeros(
+                    (stop - start, is_unchanged.shape[1] + 1), dtype=np.int32)
+                np.cumsum(is_unchanged, axis=1, out=unchanged_count[:, 1:])
+                block_status[((unchanged_count[:, max_stale_days:] - (
+                    unchanged_count[:, :-max_stale_days])) == (
+                        max_stale_days)).any(axis=1)] |= STALE_PRICE
+
+            returns = block_adj_close[:, 1:] / block_adj_close[:, :-1] - 1.0
+            block_status[(np.abs(returns) > max_abs_return).any(
+                axis=1)] |= EXTREME_JUMP
+
+    return pd.Series(status, index=symbols, name='status')